@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# Stand-ins for the go tools GoMode runs. The benchmark links this script
+# under the name of each tool, and it behaves according to its name. The
+# latency and output size of each tool are set in the environment:
+# GOMODE_FAKE_<TOOL>_LATENCY in seconds and GOMODE_FAKE_<TOOL>_SIZE, whose
+# meaning depends on the tool.
+import difflib
+import os
+import re
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import gob
+
+tool = os.path.basename(sys.argv[0])
+
+def setting(name, default):
+    value = os.environ.get("GOMODE_FAKE_%s_%s" % (tool.upper(), name))
+    if value is None:
+        return default
+    return type(default)(value)
+
+latency = setting("LATENCY", 0.0)
+
+def delay():
+    if latency > 0:
+        time.sleep(latency)
+
+def copy_stdin():
+    data = sys.stdin.buffer.read()
+    delay()
+    sys.stdout.buffer.write(data)
+
+def goflymake():
+    # Reports an error for every line that uses bad half way through the
+    # latency, like a compiler that is still busy with the rest, and SIZE
+    # more on the first line at the end.
+    name = sys.argv[-1]
+    with open(name, encoding='utf-8') as f:
+        lines = f.read().split('\n')
+    if latency > 0:
+        time.sleep(latency / 2)
+    failed = False
+    for i, line in enumerate(lines):
+        col = line.find("bad")
+        if col >= 0:
+            sys.stdout.write("%s:%d:%d: undefined: bad\n" % (name, i + 1, col + 1))
+            failed = True
+    sys.stdout.flush()
+    if latency > 0:
+        time.sleep(latency / 2)
+    for i in range(setting("SIZE", 0)):
+        sys.stdout.write("%s:1:1: padding error %d\n" % (name, i))
+        failed = True
+    return 1 if failed else 0
+
+def godef():
+    delay()
+    f = sys.argv[sys.argv.index("-f") + 1]
+    print("%s:1:1" % (f))
+
+def oracle():
+    delay()
+    for i in range(setting("SIZE", 20)):
+        print("/tmp/fake/oracle.go:%d:1: result %d" % (i + 1, i))
+
+def gorename():
+    # Renames the identifier at the offset in its file only, or prints the
+    # diff with -d.
+    filename, _, offset = sys.argv[sys.argv.index("-offset") + 1].rpartition(":#")
+    to = sys.argv[sys.argv.index("-to") + 1]
+    with open(filename, "rb") as f:
+        src = f.read()
+    start = end = int(offset)
+    while start > 0 and re.match(br'\w', src[start - 1:start]):
+        start -= 1
+    while re.match(br'\w', src[end:end + 1]):
+        end += 1
+    name = src[start:end]
+    if not name:
+        sys.stderr.write("gorename: no identifier at %s\n" % (offset))
+        return 1
+    renamed = re.sub(br'\b%s\b' % re.escape(name), to.encode('utf-8'), src)
+    delay()
+    if "-d" in sys.argv:
+        sys.stdout.writelines(difflib.unified_diff(src.decode('utf-8').splitlines(True),
+                                                   renamed.decode('utf-8').splitlines(True),
+                                                   filename + ".orig", filename))
+        return 0
+    with open(filename, "wb") as f:
+        f.write(renamed)
+    sys.stderr.write("Renamed occurrences in 1 file in 1 package.\n")
+    return 0
+
+def go():
+    if sys.argv[1:2] == ["env"]:
+        print("amd64\nlinux\n/usr/local/go\n1")
+    elif sys.argv[1:2] == ["version"]:
+        print("go version go1.4 linux/amd64")
+
+_response = gob.Struct("Response", [("ServiceMethod", gob.STRING), ("Seq", gob.UINT), ("Error", gob.STRING)])
+_candidate = gob.Struct("candidate", [("Name", gob.STRING), ("Type", gob.STRING), ("Class", gob.INT)])
+_reply_auto_complete = gob.Struct("Reply_auto_complete", [
+    ("Arg0", gob.Slice("[]candidate", _candidate)),
+    ("Arg1", gob.INT),
+])
+_args_close = gob.Struct("Args_close", [("Arg0", gob.INT)])
+_reply_close = gob.Struct("Reply_close", [("Arg0", gob.INT)])
+_request = gob.Struct("Request", [("ServiceMethod", gob.STRING), ("Seq", gob.UINT)])
+
+_words = ["Print", "Printf", "Println", "Sprintf", "Errorf", "Fprintf", "New",
+          "Read", "Write", "Close", "String", "Len", "Reset", "Buffer", "Reader"]
+
+def candidates(n):
+    result = []
+    for i in range(n):
+        name = _words[i % len(_words)]
+        if i >= len(_words):
+            name += str(i // len(_words))
+        result.append({"Name": name, "Type": "func(a ...interface{}) (n int, err error)", "Class": 1})
+    return result
+
+def serve(conn, size):
+    rfile = conn.makefile('rb')
+    decoder = gob.Decoder(rfile)
+    encoder = gob.Encoder()
+    reply_candidates = candidates(size)
+    try:
+        while True:
+            request = decoder.decode()
+            args = decoder.decode()
+            method = request.get("ServiceMethod", "")
+            response = {"ServiceMethod": method, "Seq": request.get("Seq", 0)}
+            if method == "RPC.RPC_auto_complete":
+                delay()
+                data = encoder.encode(_response, response)
+                data += encoder.encode(_reply_auto_complete, {"Arg0": reply_candidates})
+                conn.sendall(data)
+            elif method == "RPC.RPC_close":
+                conn.sendall(encoder.encode(_response, response) + encoder.encode(_reply_close, {}))
+                os._exit(0)
+            else:
+                response["Error"] = "rpc: can't find method %s" % (method)
+                conn.sendall(encoder.encode(_response, response) + encoder.encode(_reply_close, {}))
+    except (EOFError, socket.error, gob.GobError):
+        pass
+    finally:
+        conn.close()
+
+def gocode():
+    addr = "localhost:37777"
+    for arg in sys.argv[1:]:
+        if arg.startswith("-addr="):
+            addr = arg[len("-addr="):]
+    host, _, port = addr.rpartition(":")
+    addr = (host or "localhost", int(port))
+
+    if "close" in sys.argv[1:]:
+        sock = socket.create_connection(addr, 5.0)
+        encoder = gob.Encoder()
+        sock.sendall(encoder.encode(_request, {"ServiceMethod": "RPC.RPC_close", "Seq": 1}) +
+                     encoder.encode(_args_close, {}))
+        gob.Decoder(sock.makefile('rb')).decode()
+        return 0
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(addr)
+    listener.listen(16)
+    size = setting("SIZE", 100)
+    while True:
+        conn, _ = listener.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        t = threading.Thread(target=serve, args=(conn, size))
+        t.daemon = True
+        t.start()
+
+def main():
+    if tool in ("gofmt", "goimports"):
+        return copy_stdin()
+    if tool == "goflymake":
+        return goflymake()
+    if tool == "godef":
+        return godef()
+    if tool == "oracle":
+        return oracle()
+    if tool == "gorename":
+        return gorename()
+    if tool == "go":
+        return go()
+    if tool == "gocode":
+        return gocode()
+    delay()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main() or 0)
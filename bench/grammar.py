@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+# Profiles the regexes of the Go grammars. It tokenizes a corpus of Go files
+# the way a TextMate engine does, timing every search per rule, and probes
+# each regex with adversarial lines of growing length to find the ones that
+# backtrack catastrophically.
+#
+#   python3 bench/grammar.py [--grammar GoMode.tmLanguage.json] [--generate 50000] [file or dir ...]
+#
+# The grammars are written for Oniguruma and run here on Python's re, after
+# a translation of what re lacks (POSIX bracket classes, \h, \z, lookbehinds
+# with alternatives of different widths). The times are comparable between
+# rules and between versions of a grammar, not with Sublime Text's.
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(bench_dir)
+
+GRAMMARS = ["GoMode.tmLanguage.json", "GoMode-Go.tmLanguage.json"]
+
+_comment_re = re.compile(r'^\s*//.*$', re.MULTILINE)
+
+_posix_classes = {
+    "alpha": "a-zA-Z",
+    "alnum": "a-zA-Z0-9",
+    "blank": " \\t",
+    "space": "\\s",
+    "digit": "0-9",
+    "upper": "A-Z",
+    "lower": "a-z",
+    "xdigit": "0-9a-fA-F",
+    "word": "\\w",
+    "punct": "!-/:-@\\[-`{-~",
+}
+
+def _group_end(s, i):
+    # The index of the ) closing the group that starts at s[i].
+    depth = 0
+    in_class = False
+    while i < len(s):
+        ch = s[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            if ch == "]":
+                in_class = False
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    raise ValueError("unbalanced group")
+
+def _alternatives(s):
+    # s split at the | that are not in a group or a class.
+    parts = []
+    depth = 0
+    in_class = False
+    start = 0
+    i = 0
+    while i < len(s):
+        ch = s[i]
+        if ch == "\\":
+            i += 2
+            continue
+        if in_class:
+            if ch == "]":
+                in_class = False
+        elif ch == "[":
+            in_class = True
+        elif ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        elif ch == "|" and depth == 0:
+            parts.append(s[start:i])
+            start = i + 1
+        i += 1
+    parts.append(s[start:])
+    return parts
+
+def _split_lookbehinds(s):
+    # Oniguruma allows the alternatives of a lookbehind to differ in width,
+    # re doesn't: (?<=a|bc) becomes (?:(?<=a)|(?<=bc)), and (?<!a|bc)
+    # becomes (?<!a)(?<!bc).
+    out = []
+    i = 0
+    while i < len(s):
+        if s.startswith("(?<=", i) or s.startswith("(?<!", i):
+            end = _group_end(s, i)
+            kind = s[i:i + 4]
+            parts = _alternatives(_split_lookbehinds(s[i + 4:end]))
+            if len(parts) == 1:
+                out.append(kind + parts[0] + ")")
+            elif kind == "(?<=":
+                out.append("(?:" + "|".join("(?<=%s)" % p for p in parts) + ")")
+            else:
+                out.append("".join("(?<!%s)" % p for p in parts))
+            i = end + 1
+            continue
+        if s[i] == "\\":
+            out.append(s[i:i + 2])
+            i += 2
+            continue
+        out.append(s[i])
+        i += 1
+    return "".join(out)
+
+def translate(pattern):
+    '''Returns pattern, an Oniguruma regex, as a Python regex.'''
+    s = re.sub(r'\[:(\w+):\]', lambda m: _posix_classes.get(m.group(1), m.group(0)), pattern)
+    s = re.sub(r'(?<!\\)((?:\\\\)*)\\h', r'\1[0-9a-fA-F]', s)
+    s = re.sub(r'(?<!\\)((?:\\\\)*)\\H', r'\1[^0-9a-fA-F]', s)
+    s = re.sub(r'(?<!\\)((?:\\\\)*)\\z', r'\1\\Z', s)
+    if sys.version_info < (3, 11):
+        # No atomic groups or possessive quantifiers before 3.11; this
+        # changes how the regex backtracks.
+        s = s.replace("(?>", "(?:")
+        s = re.sub(r'(?<!\\)([*+?}])\+', r'\1', s)
+    try:
+        re.compile(s)
+    except re.error:
+        s = _split_lookbehinds(s)
+    return s
+
+class Regex:
+    '''A regex of the grammar with the time spent searching it.'''
+
+    def __init__(self, label, source):
+        self.label = label
+        self.source = source
+        self.calls = 0
+        self.time = 0.0
+        self.found = 0
+        self.applied = 0
+        self.error = None
+        self.rx = None
+        self.has_backrefs = bool(re.search(r'\\\d', source))
+        try:
+            self.rx = re.compile(translate(source))
+        except (re.error, ValueError) as e:
+            self.error = str(e)
+
+    def search(self, line, pos, rx=None):
+        rx = rx or self.rx
+        start = time.perf_counter()
+        m = rx.search(line, pos)
+        self.time += time.perf_counter() - start
+        self.calls += 1
+        if m is not None:
+            self.found += 1
+        return m
+
+class Rule:
+    def __init__(self, label, scope=None, match=None, begin=None, end=None, end_last=False):
+        self.label = label
+        self.scope = scope
+        self.match = match
+        self.begin = begin
+        self.end = end
+        self.end_last = end_last
+        # The rules this one contains, as a list of Rule or include names.
+        self.patterns = []
+        self.flat = None
+
+class Grammar:
+    def __init__(self, path):
+        self.path = path
+        with open(path, encoding="utf-8") as f:
+            data = json.loads(_comment_re.sub("", f.read()))
+        self.regexes = []
+        self.repository = {}
+        for name, value in data.get("repository", {}).items():
+            self.repository[name] = self.rule("repository/%s" % name, value)
+        self.root = self.rule("", {"patterns": data.get("patterns", [])})
+
+    def regex(self, label, source):
+        r = Regex(label, source)
+        self.regexes.append(r)
+        return r
+
+    def rule(self, label, d):
+        if "include" in d:
+            return d["include"]
+        r = Rule(label, d.get("name"), end_last=bool(d.get("applyEndPatternLast")))
+        scope = " " + d["name"] if d.get("name") else ""
+        if "match" in d:
+            r.match = self.regex("%s match%s" % (label, scope), d["match"])
+        if "begin" in d:
+            r.begin = self.regex("%s begin%s" % (label, scope), d["begin"])
+            r.end = self.regex("%s end%s" % (label, scope), d.get("end", "\\uffff"))
+        for i, p in enumerate(d.get("patterns", [])):
+            r.patterns.append(self.rule(("%s/patterns[%d]" % (label, i)).lstrip("/"), p))
+        return r
+
+    def flatten(self, rule):
+        '''Returns the match and begin rules that apply within rule, with the
+        includes and plain containers expanded.'''
+        if rule.flat is None:
+            rule.flat = self._flatten(rule, set([id(rule)]))
+        return rule.flat
+
+    def _flatten(self, rule, seen):
+        flat = []
+        for p in rule.patterns:
+            if isinstance(p, str):
+                if p in ("$self", "$base"):
+                    p = self.root
+                elif p.startswith("#") and p[1:] in self.repository:
+                    p = self.repository[p[1:]]
+                else:
+                    # Other grammars are not profiled.
+                    continue
+            if isinstance(p, str):
+                continue
+            if p.match is not None or p.begin is not None:
+                if (p.match or p.begin).rx is not None:
+                    flat.append(p)
+            elif id(p) not in seen:
+                seen.add(id(p))
+                flat.extend(self._flatten(p, seen))
+        return flat
+
+    def tokenize_line(self, line, stack):
+        '''Tokenizes line, updating stack, a list of (rule, compiled end
+        regex) for the begin rules that are open.'''
+        pos = 0
+        # Regex -> the match found at or after an earlier position of this
+        # line, or None if there was none.
+        cache = {}
+
+        def search(regex, rx=None):
+            key = (regex, rx)
+            if key in cache:
+                m = cache[key]
+                if m is None or m.start() >= pos:
+                    return m
+            m = regex.search(line, pos, rx)
+            cache[key] = m
+            return m
+
+        while pos <= len(line):
+            rule, end_rx = stack[-1]
+            best = None
+            best_rule = None
+            end = None
+            if rule is not self.root:
+                end = search(rule.end, end_rx)
+                if end is not None and end.start() == pos and not rule.end_last:
+                    best = end
+            if best is None:
+                for r in self.flatten(rule):
+                    m = search(r.match or r.begin)
+                    if m is not None and (best is None or m.start() < best.start()):
+                        best = m
+                        best_rule = r
+                        if m.start() == pos:
+                            break
+                if end is not None and (best is None or end.start() < best.start() or
+                                        (end.start() == best.start() and not rule.end_last)):
+                    best = end
+                    best_rule = None
+            if best is None:
+                break
+            if best_rule is None:
+                rule.end.applied += 1
+                stack.pop()
+            elif best_rule.match is not None:
+                best_rule.match.applied += 1
+            else:
+                best_rule.begin.applied += 1
+                rx = None
+                if best_rule.end.has_backrefs:
+                    source = re.sub(r'\\(\d)', lambda m: re.escape(best.group(int(m.group(1))) or ""), best_rule.end.source)
+                    try:
+                        rx = re.compile(translate(source))
+                    except re.error:
+                        rx = None
+                if rx is None and best_rule.end.rx is None:
+                    # An end that can't be compiled never matches.
+                    rx = re.compile(r'(?!)')
+                stack.append((best_rule, rx))
+            if best.end() == pos:
+                # Don't loop on empty matches.
+                pos += 1
+            else:
+                pos = best.end()
+            if len(stack) > 100:
+                del stack[1:]
+
+    def tokenize(self, text):
+        stack = [(self.root, None)]
+        for line in text.splitlines(True):
+            if not line.endswith("\n"):
+                line += "\n"
+            self.tokenize_line(line, stack)
+
+def generate(lines):
+    '''Returns about lines lines of Go resembling protoc-gen-go output.'''
+    out = ["// Code generated by protoc-gen-go.", "// source: bench.proto", "",
+           "package benchpb", "", "import proto \"github.com/golang/protobuf/proto\"",
+           "import fmt \"fmt\"", "import math \"math\"", "",
+           "var _ = proto.Marshal", "var _ = fmt.Errorf", "var _ = math.Inf", ""]
+    i = 0
+    while len(out) < lines:
+        out += [
+            "type Message%d struct {" % i,
+            "\tName  string   `protobuf:\"bytes,1,opt,name=name\" json:\"name,omitempty\"`",
+            "\tCount int32    `protobuf:\"varint,2,opt,name=count\" json:\"count,omitempty\"`",
+            "\tTags  []string `protobuf:\"bytes,3,rep,name=tags\" json:\"tags,omitempty\"`",
+            "\tXXX_unrecognized []byte `json:\"-\"`",
+            "}",
+            "",
+            "func (m *Message%d) Reset()         { *m = Message%d{} }" % (i, i),
+            "func (m *Message%d) String() string { return proto.CompactTextString(m) }" % i,
+            "func (*Message%d) ProtoMessage()    {}" % i,
+            "",
+            "func (m *Message%d) GetCount() int32 {" % i,
+            "\tif m != nil {",
+            "\t\treturn m.Count",
+            "\t}",
+            "\treturn 0",
+            "}",
+            "",
+        ]
+        i += 1
+    out += ["var fileDescriptor0 = []byte{", "\t// 4096 bytes of a gzipped FileDescriptorProto"]
+    for j in range(256):
+        out.append("\t" + " ".join("0x%02x," % ((j * 16 + k) * 37 % 256) for k in range(16)))
+    out.append("}")
+    return "\n".join(out) + "\n"
+
+def corpus(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for dirpath, dirnames, filenames in os.walk(p):
+                for name in sorted(filenames):
+                    if name.endswith(".go"):
+                        yield os.path.join(dirpath, name)
+        else:
+            yield p
+
+# Lines that make backtracking regexes blow up, as functions of a length.
+FAMILIES = [
+    ("word", lambda n: "a" * n + "!"),
+    ("spaces", lambda n: " " * n + "!"),
+    ("tabs", lambda n: "\t" * n + "!"),
+    ("list", lambda n: "a, " * (n // 3) + "!"),
+    ("params", lambda n: "func (" + "a b, " * (n // 5)),
+    ("selectors", lambda n: "a." * (n // 2) + "("),
+    ("brackets", lambda n: "[]" * (n // 2) + "{"),
+    ("escapes", lambda n: "\"" + "\\ " * (n // 2)),
+    ("digits", lambda n: "1" * n + "e+"),
+    ("percent", lambda n: "%" + "0" * n),
+]
+
+SIZES = [32, 64, 128, 256, 512, 1024, 2048]
+
+def _literals(source):
+    # The characters the regex matches literally, for a line of its own.
+    chars = sorted(set(ch for ch in re.sub(r'\\.', '', source) if ch.isalnum() or ch in " \t,.:;\"'`/*"))
+    return "".join(chars) or "a"
+
+def probe(source, budget):
+    '''Times the regex on the lines of each family at growing lengths.
+    Returns (family, ratio, seconds, length) for the family with the worst
+    growth, where ratio is the factor the time grows by when the line
+    doubles.'''
+    rx = re.compile(source)
+    literals = _literals(source)
+    families = FAMILIES + [("literals", lambda n: (literals * n)[:n] + "\x00")]
+    worst = None
+    for name, f in families:
+        times = []
+        for n in SIZES:
+            line = f(n) + "\n"
+            best = None
+            for _ in range(3):
+                start = time.perf_counter()
+                rx.search(line)
+                t = time.perf_counter() - start
+                best = t if best is None else min(best, t)
+            times.append((n, best))
+            if best > budget:
+                break
+        # The growth of the last doubling long enough to be measured.
+        ratio = 1.0
+        for (n1, t1), (n2, t2) in zip(times, times[1:]):
+            if t1 >= 20e-6:
+                ratio = t2 / t1
+        n, t = times[-1]
+        if worst is None or (ratio, t) > (worst[1], worst[2]):
+            worst = (name, ratio, t, n)
+    return worst
+
+def _probe_worker(source, budget, conn):
+    try:
+        conn.send(probe(source, budget))
+    except Exception as e:
+        conn.send(("error: %s" % e, 0.0, 0.0, 0))
+    conn.close()
+
+def probe_with_timeout(source, budget, timeout):
+    '''Runs probe in a child process, which is killed after timeout seconds.
+    Returns None on timeout.'''
+    parent, child = multiprocessing.Pipe(False)
+    p = multiprocessing.Process(target=_probe_worker, args=(source, budget, child))
+    p.start()
+    result = None
+    if parent.poll(timeout):
+        result = parent.recv()
+    p.terminate()
+    p.join()
+    return result
+
+def report_grammar(g, elapsed, lines, top):
+    out = ["grammar %s: %d lines in %.2fs, %.0f lines/s" % (
+        os.path.basename(g.path), lines, elapsed, lines / max(elapsed, 1e-9))]
+    total = sum(r.time for r in g.regexes) or 1e-9
+    out.append("%-72s %8s %8s %6s %8s %8s %8s" % ("rule", "calls", "ms", "%", "found", "applied", "us/call"))
+    for r in sorted(g.regexes, key=lambda r: -r.time)[:top]:
+        out.append("%-72s %8d %8.1f %6.1f %8d %8d %8.2f" % (
+            r.label[:72], r.calls, r.time * 1000, 100 * r.time / total, r.found, r.applied,
+            r.time * 1e6 / max(r.calls, 1)))
+    for r in g.regexes:
+        if r.error is not None:
+            out.append("not compiled: %s: %s" % (r.label, r.error))
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description="Profiles the regexes of the Go grammars.")
+    parser.add_argument("paths", nargs="*", help="Go files or directories to tokenize")
+    parser.add_argument("--grammar", action="append", help="grammar to profile, by default both JSON grammars")
+    parser.add_argument("--generate", type=int, default=0, metavar="LINES",
+                        help="also tokenize a generated protobuf-like file of this many lines")
+    parser.add_argument("--top", type=int, default=25, help="rules to show per grammar")
+    parser.add_argument("--no-probe", action="store_true", help="skip the backtracking probes")
+    parser.add_argument("--probe-timeout", type=float, default=5.0,
+                        help="seconds after which a regex is taken to backtrack catastrophically")
+    parser.add_argument("-o", "--output", help="also write the report to this file")
+    args = parser.parse_args()
+
+    grammars = args.grammar or [os.path.join(root, g) for g in GRAMMARS]
+    texts = []
+    for path in corpus(args.paths):
+        with open(path, encoding="utf-8", errors="replace") as f:
+            texts.append(f.read())
+    if args.generate or not texts:
+        texts.append(generate(args.generate or 5000))
+    lines = sum(t.count("\n") for t in texts)
+
+    out = []
+    for path in grammars:
+        g = Grammar(path)
+        start = time.perf_counter()
+        for text in texts:
+            g.tokenize(text)
+        out += report_grammar(g, time.perf_counter() - start, lines, args.top)
+
+        if not args.no_probe:
+            flagged = []
+            for source in sorted(set(translate(r.source) for r in g.regexes if r.rx is not None)):
+                result = probe_with_timeout(source, 0.1, args.probe_timeout)
+                label = [r.label for r in g.regexes if r.rx is not None and translate(r.source) == source][0]
+                if result is None:
+                    flagged.append("catastrophic  %s: no result in %.0fs" % (label, args.probe_timeout))
+                    continue
+                family, ratio, t, n = result
+                if ratio >= 6:
+                    flagged.append("catastrophic  %s: x%.1f per doubling on %s lines, %.1fms at %d chars" % (
+                        label, ratio, family, t * 1000, n))
+                elif ratio >= 3 and t >= 1e-3:
+                    flagged.append("superlinear   %s: x%.1f per doubling on %s lines, %.1fms at %d chars" % (
+                        label, ratio, family, t * 1000, n))
+            out.append("backtracking: %d of %d regexes flagged" % (len(flagged), len(g.regexes)))
+            out += flagged
+        out.append("")
+
+    report = "\n".join(out)
+    print(report, end="")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
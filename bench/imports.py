@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# Checks the fast path of formatting on save: needs_goimports must say yes
+# whenever goimports could change the imports, including when a qualifier
+# that is not imported has the name of a variable, parameter or field
+# elsewhere in the file.
+#
+#   python3 bench/imports.py
+import os
+import sys
+import types
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(bench_dir)
+sys.path.insert(0, bench_dir)
+
+import sublime
+
+# (name, source, whether goimports is needed)
+CASES = [
+    ("imports in use", '''package p
+
+import "fmt"
+
+func f() { fmt.Println() }
+''', False),
+    ("unused import", '''package p
+
+import (
+	"fmt"
+	"os"
+)
+
+func f() { fmt.Println() }
+''', True),
+    ("missing import", '''package p
+
+func f() { fmt.Println() }
+''', True),
+    ("parameter of another function", '''package p
+
+func f(bytes int) int { return bytes }
+
+func g() { bytes.NewBuffer(nil) }
+''', True),
+    ("parameter in scope", '''package p
+
+type T struct{ Name string }
+
+func f(bytes T) string { return bytes.Name }
+''', False),
+    ("variable declared after the use", '''package p
+
+import "net/http"
+
+func f(r *http.Request) string {
+	s := path.Join("a", "b")
+	path := r.URL.Path
+	return s + path
+}
+''', True),
+    ("variable in scope", '''package p
+
+import "net/http"
+
+func f(r *http.Request) string {
+	u := r.URL
+	return u.Path
+}
+''', False),
+    ("variable of a closed block", '''package p
+
+func f(ok bool) string {
+	if ok {
+		path := struct{ Base string }{}
+		_ = path
+	}
+	return path.Join("a", "b")
+}
+''', True),
+    ("composite literal key", '''package p
+
+type S struct{ time int }
+
+func f() {
+	_ = S{time: 1}
+	time.Now()
+}
+''', True),
+    ("package level variable", '''package p
+
+type config struct{ Name string }
+
+var cfg config
+
+func f() string { return cfg.Name }
+''', False),
+    ("receiver and closure parameter", '''package p
+
+import "net/http"
+
+type T struct{ n int }
+
+func (t *T) f() http.HandlerFunc {
+	return func(w http.ResponseWriter, r *http.Request) {
+		t.n++
+		_ = r.URL
+	}
+}
+''', False),
+]
+
+def main():
+    sublime.settings_path.append(root)
+    pkg = types.ModuleType("GoMode")
+    pkg.__path__ = [root]
+    sys.modules["GoMode"] = pkg
+    from GoMode import gomode
+
+    failed = 0
+    for name, src, want in CASES:
+        got = gomode.needs_goimports(src)
+        if got != want:
+            print("FAIL %s: needs_goimports = %s, want %s" % (name, got, want))
+            failed += 1
+    print("%d of %d cases passed" % (len(CASES) - failed, len(CASES)))
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+# Replays edit and keystroke traces against GoMode outside of Sublime Text and
+# reports the latencies a user would see. The plugin runs on the stub sublime
+# and sublime_plugin modules in this directory, and the go tools are replaced
+# by fake_tool.py.
+#
+#   python3 bench/run.py [--latency tool=seconds] [--size tool=n] [trace.json ...]
+#
+# A trace is a JSON object with the files of a package and the events to
+# replay on them:
+#
+#   {"files": {"main.go": "package main\n..."},
+#    "events": [{"op": "open", "file": "main.go"},
+#               {"op": "goto", "row": 3, "col": 1},
+#               {"op": "type", "text": "fmt.Println()", "interval": 0.08},
+#               {"op": "save"}]}
+#
+# The ops are open, goto, type, backspace, save, command, wait and close.
+# Each event may have a delay, in seconds since the previous one.
+import argparse
+import atexit
+import glob
+import importlib
+import json
+import os
+import re
+import shutil
+import socket
+import sys
+import tempfile
+import time
+import types
+
+bench_dir = os.path.dirname(os.path.abspath(__file__))
+root = os.path.dirname(bench_dir)
+sys.path.insert(0, bench_dir)
+
+import sublime
+import sublime_plugin
+
+TOOLS = ["gocode", "goflymake", "gofmt", "goimports", "godef", "oracle", "gorename", "go", "git"]
+
+# Seconds, roughly what the real tools take on a small package.
+DEFAULT_LATENCY = {
+    "gocode": 0.01,
+    "goflymake": 0.2,
+    "gofmt": 0.01,
+    "goimports": 0.08,
+    "godef": 0.05,
+    "oracle": 0.5,
+    "gorename": 0.3,
+}
+
+MARKS = "gomode-outlines-illegal"
+word_re = re.compile(r'\w*$')
+
+def percentile(samples, p):
+    if not samples:
+        return 0.0
+    s = sorted(samples)
+    return s[min(len(s) - 1, int(p * len(s)))]
+
+def free_port():
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def port_open(port):
+    try:
+        socket.create_connection(("127.0.0.1", port), 0.05).close()
+        return True
+    except socket.error:
+        return False
+
+def load_plugins():
+    '''Imports the plugin modules as the GoMode package, like Sublime Text
+    does, and registers their commands and listeners.'''
+    pkg = types.ModuleType("GoMode")
+    pkg.__path__ = [root]
+    sys.modules["GoMode"] = pkg
+    for path in sorted(glob.glob(os.path.join(root, "*.py"))):
+        name = os.path.splitext(os.path.basename(path))[0]
+        if name == "__init__":
+            continue
+        sublime_plugin.load_plugin(importlib.import_module("GoMode." + name))
+
+class Replay:
+    def __init__(self, trace, gopath, settle):
+        self.trace = trace
+        self.settle = settle
+        self.name = os.path.splitext(os.path.basename(trace))[0]
+        with open(trace) as f:
+            self.data = json.load(f)
+        self.dir = os.path.join(gopath, "src", "bench", self.name)
+        self.window = sublime.active_window()
+        self.views = []
+        self.view = None
+
+        # Samples, in seconds.
+        self.completion = []
+        self.marks = []
+        self.format = []
+        self.keystrokes = 0
+        self.superseded = 0
+        # The keystroke waiting for completions: (view id, time).
+        self.waiting = None
+        # view id -> time of the last edit whose marks are not drawn yet.
+        self.edited = {}
+
+    def setup(self):
+        os.makedirs(self.dir)
+        for name, text in self.data.get("files", {}).items():
+            with open(os.path.join(self.dir, name), "w", encoding="utf-8") as f:
+                f.write(text)
+        sublime.builtin_commands["auto_complete"] = self.auto_complete
+        sublime.region_hooks[:] = [self.regions_changed]
+
+    def query_completions(self, view):
+        pos = view.sel()[0].b
+        prefix = word_re.search(view.substr(sublime.Region(max(0, pos - 256), pos))).group(0)
+        completions = []
+        for r in sublime_plugin.dispatch("on_query_completions", view, prefix, [pos]):
+            if isinstance(r, tuple):
+                r = r[0]
+            completions.extend(r or [])
+        return completions
+
+    # The plugin asked for the completion popup to be shown again.
+    def auto_complete(self, view, args):
+        if self.query_completions(view) and self.waiting is not None and self.waiting[0] == view.id():
+            self.completion.append(time.time() - self.waiting[1])
+            self.waiting = None
+
+    def regions_changed(self, view, key, regions):
+        if key != MARKS:
+            return
+        t = self.edited.pop(view.id(), None)
+        if t is not None:
+            self.marks.append(time.time() - t)
+
+    def edit(self, f, command):
+        view = self.view
+        now = time.time()
+        f(view)
+        view._history = (command, None, 1)
+        sublime_plugin.dispatch("on_modified", view)
+        sublime_plugin.dispatch("on_selection_modified", view)
+        self.edited[view.id()] = now
+        return now
+
+    def keystroke(self, ch):
+        def insert(view):
+            pos = view.sel()[0].b
+            view.insert(sublime.Edit(), pos, ch)
+        now = self.edit(insert, "insert")
+        self.keystrokes += 1
+        if self.waiting is not None:
+            self.superseded += 1
+            self.waiting = None
+        if re.match(r'[\w.]', ch):
+            if self.query_completions(self.view):
+                self.completion.append(time.time() - now)
+            else:
+                self.waiting = (self.view.id(), now)
+
+    def backspace(self):
+        def erase(view):
+            pos = view.sel()[0].b
+            if pos > 0:
+                view.erase(sublime.Edit(), sublime.Region(pos - 1, pos))
+        self.edit(erase, "left_delete")
+
+    def open(self, name):
+        view = self.window.open_file(os.path.join(self.dir, name))
+        self.views.append(view)
+        self.view = view
+        sublime_plugin.dispatch("on_load", view)
+        sublime_plugin.dispatch("on_activated", view)
+
+    def goto(self, row, col):
+        view = self.view
+        view.sel().clear()
+        view.sel().add(sublime.Region(view.text_point(row, col)))
+        sublime_plugin.dispatch("on_selection_modified", view)
+
+    def save(self):
+        view = self.view
+        start = time.time()
+        sublime_plugin.dispatch("on_pre_save", view)
+        self.format.append(time.time() - start)
+        with open(view.file_name(), "w", encoding="utf-8") as f:
+            f.write(view.substr(sublime.Region(0, view.size())))
+        sublime_plugin.dispatch("on_post_save", view)
+
+    def command(self, name, args):
+        if name in sublime_plugin.window_commands:
+            self.window.run_command(name, args)
+        else:
+            self.view.run_command(name, args)
+
+    def close(self, view):
+        sublime_plugin.dispatch("on_close", view)
+        view._valid = False
+        if self.view is view:
+            self.view = None
+
+    def schedule(self):
+        '''Returns the actions of the trace as a list of (offset, f).'''
+        actions = []
+        t = 0.0
+        for e in self.data.get("events", []):
+            t += e.get("delay", 0.1)
+            op = e["op"]
+            if op == "open":
+                actions.append((t, lambda name=e["file"]: self.open(name)))
+            elif op == "goto":
+                actions.append((t, lambda row=e["row"], col=e.get("col", 0): self.goto(row, col)))
+            elif op == "type":
+                interval = e.get("interval", 0.08)
+                for i, ch in enumerate(e["text"]):
+                    actions.append((t + i * interval, lambda ch=ch: self.keystroke(ch)))
+                t += len(e["text"]) * interval
+            elif op == "backspace":
+                interval = e.get("interval", 0.08)
+                for i in range(e.get("count", 1)):
+                    actions.append((t + i * interval, self.backspace))
+                t += e.get("count", 1) * interval
+            elif op == "save":
+                actions.append((t, self.save))
+            elif op == "command":
+                actions.append((t, lambda name=e["name"], args=e.get("args"): self.command(name, args)))
+            elif op == "wait":
+                t += e.get("seconds", 1.0)
+            elif op == "close":
+                actions.append((t, lambda: self.close(self.view)))
+            else:
+                raise ValueError("%s: unknown op %s" % (self.trace, op))
+        return actions, t
+
+    def settled(self):
+        return self.waiting is None and not self.edited and sublime.loop.idle()
+
+    def run(self):
+        self.setup()
+        actions, duration = self.schedule()
+        start = time.time()
+        for offset, f in actions:
+            sublime.loop.add(f, offset)
+        blocking = len(sublime.loop.blocking)
+        sublime.loop.run_until(start + duration)
+        sublime.loop.run_until(time.time() + self.settle, self.settled)
+        self.elapsed = time.time() - start
+        self.blocking = sublime.loop.blocking[blocking:]
+        for view in list(self.views):
+            if view.is_valid():
+                self.close(view)
+        sublime.loop.run_until(time.time() + 0.1)
+
+    def report(self):
+        lines = ["trace %s: %d keystrokes, %d superseded before completing, %.1fs" % (
+            self.name, self.keystrokes, self.superseded, self.elapsed)]
+        lines.append("%-24s %6s %9s %9s %9s %9s" % ("metric", "count", "p50 ms", "p95 ms", "p99 ms", "max ms"))
+        for name, samples in [("keystroke->completion", self.completion),
+                              ("edit->error marks", self.marks),
+                              ("save->format", self.format),
+                              ("ui thread callback", self.blocking)]:
+            lines.append("%-24s %6d %9.1f %9.1f %9.1f %9.1f" % (
+                name, len(samples), percentile(samples, 0.5) * 1000, percentile(samples, 0.95) * 1000,
+                percentile(samples, 0.99) * 1000, max(samples or [0]) * 1000))
+        stalls = len([b for b in self.blocking if b > 0.05])
+        lines.append("ui thread busy %.1fms in total, %d callbacks over 50ms" % (sum(self.blocking) * 1000, stalls))
+        return "\n".join(lines) + "\n"
+
+def parse_tool_values(values, convert):
+    result = {}
+    for v in values or []:
+        tool, _, value = v.partition("=")
+        if tool not in TOOLS or not value:
+            raise SystemExit("bad tool setting %s, want tool=value with tool one of %s" % (v, ", ".join(TOOLS)))
+        result[tool] = convert(value)
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays traces against GoMode with fake go tools.")
+    parser.add_argument("traces", nargs="*", help="trace files, by default bench/traces/*.json")
+    parser.add_argument("--latency", action="append", metavar="TOOL=SECONDS", help="latency of a fake tool")
+    parser.add_argument("--size", action="append", metavar="TOOL=N",
+                        help="output size of a fake tool: gocode candidates, goflymake or oracle lines")
+    parser.add_argument("--settle", type=float, default=5.0,
+                        help="seconds to wait for results after the last event of a trace")
+    parser.add_argument("-o", "--output", help="also write the report to this file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="show what the plugin prints")
+    args = parser.parse_args()
+
+    traces = args.traces or sorted(glob.glob(os.path.join(bench_dir, "traces", "*.json")))
+    latency = dict(DEFAULT_LATENCY)
+    latency.update(parse_tool_values(args.latency, float))
+    sizes = parse_tool_values(args.size, int)
+
+    tmp = tempfile.mkdtemp(prefix="gomode-bench")
+    bindir = os.path.join(tmp, "bin")
+    gopath = os.path.join(tmp, "gopath")
+    os.makedirs(bindir)
+    os.makedirs(gopath)
+    for tool in TOOLS:
+        os.symlink(os.path.join(bench_dir, "fake_tool.py"), os.path.join(bindir, tool))
+    os.environ["PATH"] = bindir + os.pathsep + os.environ.get("PATH", "")
+    os.environ["GOPATH"] = gopath
+    for tool, value in latency.items():
+        os.environ["GOMODE_FAKE_%s_LATENCY" % tool.upper()] = str(value)
+    for tool, value in sizes.items():
+        os.environ["GOMODE_FAKE_%s_SIZE" % tool.upper()] = str(value)
+
+    port = free_port()
+    sublime.settings_path.append(root)
+    sublime.load_settings("GoMode.sublime-settings").set("gocode_address", "-addr=127.0.0.1:%d" % port)
+
+    out = sys.stdout
+    log = None
+    if not args.verbose:
+        log = open(os.path.join(tmp, "plugin.log"), "w")
+        sys.stdout = log
+    try:
+        load_plugins()
+        # The plugin starts the gocode daemon from a timeout.
+        if not sublime.loop.run_until(time.time() + 10, lambda: port_open(port)):
+            raise SystemExit("gocode did not start")
+
+        reports = []
+        for trace in traces:
+            r = Replay(trace, gopath, args.settle)
+            r.run()
+            reports.append(r.report())
+        from GoMode.stats import stats
+        report = "\n".join(reports) + "\ntools\n" + stats.report()
+    finally:
+        # Stop the gocode daemon while the fake tools are still there.
+        gomode = sys.modules.get("GoMode.gomode")
+        if gomode is not None:
+            atexit.unregister(gomode.kill_gocode)
+            gomode.kill_gocode()
+        sys.stdout = out
+        if log is not None:
+            log.close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    print(report, end="")
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+# A stand-in for Sublime Text's sublime module, for running GoMode headless.
+# It covers the part of the API GoMode uses. The thread that runs
+# loop.run_until plays the UI thread: set_timeout callbacks and the events
+# the benchmark dispatches run there, and the time each one takes is
+# recorded in loop.blocking.
+import heapq
+import itertools
+import json
+import os
+import re
+import threading
+import time
+import traceback
+
+ENCODED_POSITION = 1
+TRANSIENT = 4
+DRAW_OUTLINED = 32
+MONOSPACE_FONT = 1
+HIDDEN = 128
+
+class Region:
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def size(self):
+        return self.end() - self.begin()
+
+    def empty(self):
+        return self.a == self.b
+
+    def contains(self, x):
+        if isinstance(x, Region):
+            return self.begin() <= x.begin() and x.end() <= self.end()
+        return self.begin() <= x <= self.end()
+
+    def __eq__(self, other):
+        return isinstance(other, Region) and (self.a, self.b) == (other.a, other.b)
+
+    def __repr__(self):
+        return "(%d, %d)" % (self.a, self.b)
+
+class Selection:
+    def __init__(self):
+        self.regions = [Region(0)]
+
+    def __len__(self):
+        return len(self.regions)
+
+    def __getitem__(self, i):
+        return self.regions[i]
+
+    def __iter__(self):
+        return iter(list(self.regions))
+
+    def clear(self):
+        self.regions = []
+
+    def add(self, r):
+        if not isinstance(r, Region):
+            r = Region(r)
+        self.regions.append(r)
+        self.regions.sort(key=lambda r: r.begin())
+
+class Settings:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.callbacks = {}
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def has(self, key):
+        return key in self.values
+
+    def set(self, key, value):
+        self.values[key] = value
+        for f in list(self.callbacks.values()):
+            f()
+
+    def erase(self, key):
+        self.values.pop(key, None)
+
+    def add_on_change(self, tag, f):
+        self.callbacks[tag] = f
+
+    def clear_on_change(self, tag):
+        self.callbacks.pop(tag, None)
+
+_comment_re = re.compile(r'^\s*//.*$', re.MULTILINE)
+
+def _read_settings(path):
+    try:
+        with open(path) as f:
+            return json.loads(_comment_re.sub('', f.read()))
+    except (IOError, OSError, ValueError):
+        return {}
+
+# Where load_settings looks for the defaults of a settings file.
+settings_path = []
+_settings = {}
+
+def load_settings(name):
+    s = _settings.get(name)
+    if s is None:
+        values = {}
+        for d in settings_path:
+            values.update(_read_settings(os.path.join(d, name)))
+        s = _settings[name] = Settings(values)
+    return s
+
+def save_settings(name):
+    pass
+
+class Edit:
+    pass
+
+# Hooks for the benchmark: name -> f(view_or_window, args) for the builtin
+# commands, and f(view, key, regions) called when regions are set.
+builtin_commands = {}
+region_hooks = []
+
+_view_ids = itertools.count(1)
+
+class View:
+    def __init__(self, window, file_name=None, text=""):
+        self._id = next(_view_ids)
+        self._window = window
+        self._file_name = file_name
+        self._name = ""
+        self._text = text
+        self._sel = Selection()
+        self._settings = Settings()
+        self._scratch = False
+        self._change_count = 0
+        self._regions = {}
+        self._status = {}
+        self._syntax = "Packages/GoMode/GoMode.tmLanguage" if file_name and file_name.endswith(".go") else ""
+        self._commands = {}
+        self._valid = True
+        # The last modifying command, as command_history returns it.
+        self._history = ("", None, 0)
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def window(self):
+        return self._window if self._valid else None
+
+    def is_valid(self):
+        return self._valid
+
+    def is_loading(self):
+        return False
+
+    def file_name(self):
+        return self._file_name
+
+    def name(self):
+        return self._name
+
+    def set_name(self, name):
+        self._name = name
+
+    def is_scratch(self):
+        return self._scratch
+
+    def set_scratch(self, scratch):
+        self._scratch = scratch
+
+    def is_dirty(self):
+        return self._change_count > 0
+
+    def settings(self):
+        return self._settings
+
+    def set_syntax_file(self, syntax):
+        self._syntax = syntax
+
+    def score_selector(self, pos, selector):
+        if selector == "source.go" and "GoMode" in self._syntax:
+            return 1
+        return 0
+
+    def size(self):
+        return len(self._text)
+
+    def substr(self, x):
+        if isinstance(x, Region):
+            return self._text[x.begin():x.end()]
+        return self._text[x:x + 1]
+
+    def change_count(self):
+        return self._change_count
+
+    def command_history(self, index, modifying_only=False):
+        if index == 0:
+            return self._history
+        return ("", None, 0)
+
+    def sel(self):
+        return self._sel
+
+    def rowcol(self, pos):
+        pos = max(0, min(pos, len(self._text)))
+        row = self._text.count('\n', 0, pos)
+        return (row, pos - (self._text.rfind('\n', 0, pos) + 1))
+
+    def text_point(self, row, col):
+        i = 0
+        for _ in range(row):
+            j = self._text.find('\n', i)
+            if j < 0:
+                return len(self._text)
+            i = j + 1
+        return min(i + col, len(self._text))
+
+    def line(self, x):
+        if isinstance(x, Region):
+            a, b = x.begin(), x.end()
+        else:
+            a = b = x
+        start = self._text.rfind('\n', 0, a) + 1
+        end = self._text.find('\n', b)
+        if end < 0:
+            end = len(self._text)
+        return Region(start, end)
+
+    def full_line(self, x):
+        r = self.line(x)
+        return Region(r.a, min(r.b + 1, len(self._text)))
+
+    def _edited(self, pos, removed, inserted):
+        self._change_count += 1
+        delta = inserted - removed
+        for r in self._sel.regions:
+            if r.a >= pos + removed:
+                r.a += delta
+            elif r.a > pos:
+                r.a = pos + inserted
+            if r.b >= pos + removed:
+                r.b += delta
+            elif r.b > pos:
+                r.b = pos + inserted
+
+    def insert(self, edit, pos, text):
+        self._text = self._text[:pos] + text + self._text[pos:]
+        self._edited(pos, 0, len(text))
+        return len(text)
+
+    def erase(self, edit, r):
+        self._text = self._text[:r.begin()] + self._text[r.end():]
+        self._edited(r.begin(), r.size(), 0)
+
+    def replace(self, edit, r, text):
+        self._text = self._text[:r.begin()] + text + self._text[r.end():]
+        self._edited(r.begin(), r.size(), len(text))
+
+    def add_regions(self, key, regions, scope="", icon="", flags=0):
+        self._regions[key] = list(regions)
+        for f in region_hooks:
+            f(self, key, regions)
+
+    def get_regions(self, key):
+        return list(self._regions.get(key, []))
+
+    def erase_regions(self, key):
+        self._regions.pop(key, None)
+        for f in region_hooks:
+            f(self, key, [])
+
+    def set_status(self, key, value):
+        self._status[key] = value
+
+    def get_status(self, key):
+        return self._status.get(key, "")
+
+    def erase_status(self, key):
+        self._status.pop(key, None)
+
+    def show(self, x, show_surrounds=True):
+        pass
+
+    def show_at_center(self, x):
+        pass
+
+    def set_viewport_position(self, xy, animate=True):
+        pass
+
+    def text_to_layout(self, pos):
+        return (0.0, 0.0)
+
+    def run_command(self, name, args=None):
+        from sublime_plugin import text_commands
+        cls = text_commands.get(name)
+        if cls is None:
+            f = builtin_commands.get(name)
+            if f is not None:
+                f(self, args or {})
+            return
+        cmd = self._commands.get(name)
+        if cmd is None:
+            cmd = self._commands[name] = cls(self)
+        count = self._change_count
+        cmd.run(Edit(), **(args or {}))
+        if self._change_count != count:
+            self._history = (name, args, 1)
+
+_window_ids = itertools.count(1)
+
+class Window:
+    def __init__(self):
+        self._id = next(_window_ids)
+        self._views = []
+        self._folders = []
+        self._panels = {}
+        self._active = None
+        self._commands = {}
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return [v for v in self._views if v._valid]
+
+    def folders(self):
+        return list(self._folders)
+
+    def active_view(self):
+        return self._active
+
+    def new_file(self):
+        v = View(self)
+        self._views.append(v)
+        self._active = v
+        return v
+
+    def add_view(self, view):
+        self._views.append(view)
+        self._active = view
+
+    def find_open_file(self, file_name):
+        for v in self.views():
+            if v.file_name() == file_name:
+                return v
+        return None
+
+    def open_file(self, file_name, flags=0):
+        path = file_name
+        if flags & ENCODED_POSITION:
+            path = re.sub(r'(:\d+)+$', '', file_name)
+        v = self.find_open_file(path)
+        if v is None:
+            try:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+            except (IOError, OSError):
+                text = ""
+            v = View(self, path, text)
+            self._views.append(v)
+        self._active = v
+        return v
+
+    def focus_view(self, view):
+        self._active = view
+
+    def create_output_panel(self, name):
+        v = self._panels.get(name)
+        if v is None:
+            v = self._panels[name] = View(self)
+        return v
+
+    def show_input_panel(self, caption, initial, on_done, on_change, on_cancel):
+        f = builtin_commands.get("show_input_panel")
+        if f is not None:
+            f(self, {"caption": caption, "initial": initial, "on_done": on_done})
+        return self.new_file()
+
+    def show_quick_panel(self, items, on_select, flags=0, selected_index=-1, on_highlight=None):
+        f = builtin_commands.get("show_quick_panel")
+        if f is not None:
+            f(self, {"items": items, "on_select": on_select})
+
+    def run_command(self, name, args=None):
+        from sublime_plugin import window_commands
+        cls = window_commands.get(name)
+        if cls is None:
+            f = builtin_commands.get(name)
+            if f is not None:
+                f(self, args or {})
+            return
+        cmd = self._commands.get(name)
+        if cmd is None:
+            cmd = self._commands[name] = cls(self)
+        cmd.run(**(args or {}))
+
+_windows = [Window()]
+
+def windows():
+    return list(_windows)
+
+def active_window():
+    return _windows[0]
+
+def status_message(msg):
+    pass
+
+def message_dialog(msg):
+    pass
+
+def error_message(msg):
+    pass
+
+def ok_cancel_dialog(msg, ok_title=""):
+    f = builtin_commands.get("ok_cancel_dialog")
+    if f is not None:
+        return f(None, {"msg": msg})
+    return True
+
+def platform():
+    return "linux"
+
+def version():
+    return "3103"
+
+class Loop:
+    '''The UI thread's queue of callbacks.'''
+
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.queue = []
+        self.seq = itertools.count()
+        self.thread = None
+        # Seconds spent in each callback run on the UI thread.
+        self.blocking = []
+
+    def add(self, f, delay=0.0):
+        with self.lock:
+            heapq.heappush(self.queue, (time.time() + delay, next(self.seq), f))
+            self.lock.notify()
+
+    def call(self, f, *args):
+        '''Runs f on the UI thread, which must be the calling thread, and
+        records how long it took.'''
+        start = time.time()
+        try:
+            return f(*args)
+        except Exception:
+            traceback.print_exc()
+        finally:
+            self.blocking.append(time.time() - start)
+
+    def run_until(self, deadline, done=None):
+        '''Runs callbacks until deadline, or until done() is true.'''
+        self.thread = threading.current_thread()
+        while True:
+            if done is not None and done():
+                return True
+            with self.lock:
+                now = time.time()
+                if now >= deadline:
+                    return False
+                if not self.queue or self.queue[0][0] > now:
+                    wait = deadline - now
+                    if self.queue:
+                        wait = min(wait, self.queue[0][0] - now)
+                    self.lock.wait(min(wait, 0.01))
+                    continue
+                due, seq, f = heapq.heappop(self.queue)
+            self.call(f)
+
+    def idle(self):
+        with self.lock:
+            return not self.queue
+
+loop = Loop()
+
+def set_timeout(f, delay=0):
+    loop.add(f, delay / 1000.0)
+
+class _AsyncWorker:
+    def __init__(self):
+        self.lock = threading.Condition()
+        self.queue = []
+        self.seq = itertools.count()
+        t = threading.Thread(target=self.run)
+        t.daemon = True
+        t.start()
+
+    def add(self, f, delay):
+        with self.lock:
+            heapq.heappush(self.queue, (time.time() + delay, next(self.seq), f))
+            self.lock.notify()
+
+    def run(self):
+        while True:
+            with self.lock:
+                while not self.queue or self.queue[0][0] > time.time():
+                    self.lock.wait(0.01)
+                due, seq, f = heapq.heappop(self.queue)
+            try:
+                f()
+            except Exception:
+                traceback.print_exc()
+
+_async = None
+
+def set_timeout_async(f, delay=0):
+    global _async
+    if _async is None:
+        _async = _AsyncWorker()
+    _async.add(f, delay / 1000.0)
@@ -0,0 +1,66 @@
+# A stand-in for Sublime Text's sublime_plugin module. load_plugin registers
+# the commands and event listeners of a plugin module the way Sublime Text
+# does, and the benchmark dispatches events to listeners.
+import re
+import traceback
+
+class EventListener:
+    pass
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
+
+    def is_enabled(self):
+        return True
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
+
+    def is_enabled(self):
+        return True
+
+class ApplicationCommand:
+    def is_enabled(self):
+        return True
+
+# command name -> class
+text_commands = {}
+window_commands = {}
+application_commands = {}
+listeners = []
+
+def command_name(cls):
+    name = cls.__name__
+    if name.endswith("Command"):
+        name = name[:-len("Command")]
+    return re.sub(r'(?<=[a-z0-9])([A-Z])', r'_\1', name).lower()
+
+def load_plugin(module):
+    for name in dir(module):
+        cls = getattr(module, name)
+        if not isinstance(cls, type) or cls.__module__ != module.__name__:
+            continue
+        if issubclass(cls, TextCommand):
+            text_commands[command_name(cls)] = cls
+        elif issubclass(cls, WindowCommand):
+            window_commands[command_name(cls)] = cls
+        elif issubclass(cls, ApplicationCommand):
+            application_commands[command_name(cls)] = cls
+        elif issubclass(cls, EventListener):
+            listeners.append(cls())
+
+def dispatch(event, *args):
+    '''Calls event on every listener that has it and returns the results.
+    It must be called on the UI thread.'''
+    results = []
+    for l in listeners:
+        f = getattr(l, event, None)
+        if f is None:
+            continue
+        try:
+            results.append(f(*args))
+        except Exception:
+            traceback.print_exc()
+    return results
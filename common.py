@@ -1,33 +1,222 @@
 import sublime
 import os
 import subprocess
+import threading
+import time
+
+from .stats import stats
+
+# Resolved settings and environments are cached until the settings change.
+_settings = None
+# (view id, key) -> value, with _missing for keys the view doesn't set.
+_setting_cache = {}
+# view id -> environment
+_env_cache = {}
+# ids of the views whose settings are watched.
+_watched_views = set()
+_missing = object()
+
+def clear_settings_cache():
+    _setting_cache.clear()
+    _env_cache.clear()
+
+def _clear_view_cache(view_id):
+    # Other threads add to the cache meanwhile. list() copies the keys in one
+    # step, where iterating the dict could see it change size.
+    for k in list(_setting_cache):
+        if k[0] == view_id:
+            _setting_cache.pop(k, None)
+    _env_cache.pop(view_id, None)
+
+def forget_view(view):
+    '''Drops what is cached for a view that was closed.'''
+    _clear_view_cache(view.id())
+    _watched_views.discard(view.id())
+
+def _watch_view(view):
+    # Project settings reach us through the view's settings too.
+    if view.id() in _watched_views:
+        return
+    _watched_views.add(view.id())
+    view_id = view.id()
+    view.settings().add_on_change("gomode_settings_cache", lambda: _clear_view_cache(view_id))
 
 def get_settings():
-    return sublime.load_settings("GoMode.sublime-settings")
+    global _settings
+    if _settings is None:
+        _settings = sublime.load_settings("GoMode.sublime-settings")
+        _settings.add_on_change("gomode_settings_cache", clear_settings_cache)
+    return _settings
 
-def get_setting(key, default=None, view=None):
+def _active_view():
     try:
-        if view == None:
-            view = sublime.active_window().active_view()
-        s = view.settings()
-        if s.has("go_%s" % key):
-            return s.get("go_%s" % key)
-    except:
-        pass
-    return get_settings().get(key, default)
-
-def getenv():
-    env = os.environ.copy()
-    userenv = get_setting("env")
-    for k in userenv:
-        env[k] = os.path.expandvars(userenv[k])
+        return sublime.active_window().active_view()
+    except AttributeError:
+        return None
+
+def get_setting(key, default=None, view=None):
+    if view == None:
+        view = _active_view()
+    view_id = view.id() if view is not None else None
+    value = _setting_cache.get((view_id, key), _missing)
+    if value is _missing and (view_id, key) not in _setting_cache:
+        try:
+            s = view.settings()
+            _watch_view(view)
+            if s.has("go_%s" % key):
+                value = s.get("go_%s" % key)
+        except:
+            pass
+        if value is _missing:
+            value = get_settings().get(key, _missing)
+        _setting_cache[(view_id, key)] = value
+    if value is _missing:
+        return default
+    return value
+
+def getenv(view=None):
+    '''Returns the environment for the go tools: ours, updated with the env
+    setting. The result is shared and must not be modified.'''
+    if view == None:
+        view = _active_view()
+    view_id = view.id() if view is not None else None
+    env = _env_cache.get(view_id)
+    if env is None:
+        env = os.environ.copy()
+        userenv = get_setting("env", {}, view)
+        for k in userenv:
+            env[k] = os.path.expandvars(userenv[k])
+        _env_cache[view_id] = env
     return env
 
-def openProcess(args,env=None,cwd=None,stdin=None,stdout=None,stderr=None, shell=False):
+class TimedProcess(subprocess.Popen):
+    '''A process whose run is recorded in stats once it has exited.
+    Callers that read its pipes themselves add what they read to payload.'''
+
+    def __init__(self, args, queued=None, **kwargs):
+        self.tool = os.path.basename(args[0] if isinstance(args, (list, tuple)) else args.split()[0])
+        self.started = time.time()
+        self.wait_time = self.started - queued if queued is not None else 0.0
+        self.payload = 0
+        self.recorded = False
+        self.communicating = False
+        subprocess.Popen.__init__(self, args, **kwargs)
+
+    def communicate(self, input=None, timeout=None):
+        self.communicating = True
+        try:
+            stdout, stderr = subprocess.Popen.communicate(self, input, timeout)
+        finally:
+            self.communicating = False
+        self.payload += len(input or b'') + len(stdout or b'') + len(stderr or b'')
+        self.record()
+        return stdout, stderr
+
+    def wait(self, timeout=None):
+        returncode = subprocess.Popen.wait(self, timeout)
+        if not self.communicating:
+            self.record()
+        return returncode
+
+    def poll(self):
+        returncode = subprocess.Popen.poll(self)
+        if returncode is not None and not self.communicating:
+            self.record()
+        return returncode
+
+    def record(self):
+        if self.recorded or self.returncode is None:
+            return
+        self.recorded = True
+        stats.record(self.tool, self.started, time.time() - self.started, self.returncode,
+                     self.payload, self.wait_time, get_setting("perf_trace_file"))
+
+def openProcess(args,env=None,cwd=None,stdin=None,stdout=None,stderr=None, shell=False, queued=None):
     startupinfo = None
 
     if os.name == 'nt':
         startupinfo = subprocess.STARTUPINFO()
         startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
-    proc = subprocess.Popen(args,bufsize=-1,env=env,cwd=cwd,stdin=stdin,stdout=stdout,stderr=stderr,startupinfo=startupinfo, shell=shell)
+    proc = TimedProcess(args,queued=queued,bufsize=-1,env=env,cwd=cwd,stdin=stdin,stdout=stdout,stderr=stderr,startupinfo=startupinfo, shell=shell)
     return proc
+
+def cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except (ImportError, NotImplementedError):
+        return 1
+
+def view_is_valid(view):
+    if hasattr(view, 'is_valid'):
+        return view.is_valid()
+    return view.window() is not None
+
+class OutputStream:
+    '''Collects the output of a process as it is read, on any thread, and
+    hands it to write on the main thread in batches of whole lines, at most
+    every interval seconds. At most limit characters are passed on, the rest
+    is counted in dropped.'''
+
+    def __init__(self, write, limit=0, interval=0.1):
+        self.write = write
+        self.limit = limit
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.partial = b''
+        self.pending = []
+        self.scheduled = False
+        self.size = 0
+        self.dropped = 0
+        self.shown = []
+
+    def feed(self, data):
+        data = self.partial + data
+        i = data.rfind(b'\n')
+        if i < 0:
+            self.partial = data
+            return
+        self.partial = data[i + 1:]
+        self.add(data[:i + 1].decode('utf-8', 'replace'))
+
+    def add(self, text):
+        with self.lock:
+            if self.dropped:
+                # Keep the output contiguous once some of it was dropped.
+                self.dropped += len(text)
+                return
+            if self.limit > 0 and self.size + len(text) > self.limit:
+                room = self.limit - self.size
+                keep = text.rfind('\n', 0, room) + 1
+                self.dropped += len(text) - keep
+                text = text[:keep]
+            if not text:
+                return
+            self.size += len(text)
+            self.pending.append(text)
+            self.shown.append(text)
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            sublime.set_timeout(self.flush, int(self.interval * 1000))
+
+    # Run in main thread.
+    def flush(self):
+        with self.lock:
+            text = ''.join(self.pending)
+            self.pending = []
+            self.scheduled = False
+        if text:
+            self.write(text)
+
+    def close(self):
+        '''Passes on any output left, including an unterminated last line.'''
+        if self.partial:
+            self.add(self.partial.decode('utf-8', 'replace') + '\n')
+            self.partial = b''
+        sublime.set_timeout(self.flush, 0)
+
+    def text(self):
+        '''Returns all the output that was passed on.'''
+        with self.lock:
+            return ''.join(self.shown)
@@ -2,77 +2,109 @@
 # https://github.com/quarnster/SublimeClang
 import sublime
 import sublime_plugin
-from collections import defaultdict
+import bisect
 
 from .common import *
 
-def sencode(s):
-    return s.encode("utf-8")
-
-def sdecode(s):
-    return s
+class ErrorStore:
+    '''The errors for a single file, kept sorted by line.'''
 
+    def __init__(self):
+        self.lines = []
+        # line -> [message]
+        self.messages = {}
+        # line -> column of the first error on the line that has one.
+        self.columns = {}
+
+    def add(self, line, message, column=None):
+        if line not in self.messages:
+            if not self.lines or line > self.lines[-1]:
+                self.lines.append(line)
+            else:
+                bisect.insort(self.lines, line)
+            self.messages[line] = []
+        self.messages[line].append(message)
+        if column is not None and line not in self.columns:
+            self.columns[line] = column
+
+    def position(self, filename, line):
+        '''Returns the error on line of filename as file:line:col.'''
+        return "%s:%d:%d" % (filename, line + 1, self.columns.get(line, 0) + 1)
+
+    def next(self, line):
+        i = bisect.bisect_right(self.lines, line)
+        if i < len(self.lines):
+            return self.lines[i]
+        return -1
+
+    def previous(self, line):
+        i = bisect.bisect_left(self.lines, line)
+        if i > 0:
+            return self.lines[i - 1]
+        return -1
+
+# filename -> ErrorStore
 ERRORS = {}
 ERROR = "error"
 
+# view id -> (change count, lines) of the marks last drawn in the view.
+DRAWN = {}
+
 class GoModeNext(sublime_plugin.TextCommand):
     def run(self, edit):
         v = self.view
-        fn = sencode(v.file_name())
+        fn = v.file_name()
         line, column = v.rowcol(v.sel()[0].a)
         gotoline = -1
         if fn in ERRORS:
-            for errLine in ERRORS[fn]:
-                if errLine > line:
-                    gotoline = errLine
-                    break
+            gotoline = ERRORS[fn].next(line)
         if gotoline != -1:
-            v.window().open_file("%s:%d" % (fn, gotoline + 1), sublime.ENCODED_POSITION)
+            v.window().open_file(ERRORS[fn].position(fn, gotoline), sublime.ENCODED_POSITION)
         else:
             sublime.status_message("No more errors or warnings!")
 
 class GoModePrevious(sublime_plugin.TextCommand):
     def run(self, edit):
         v = self.view
-        fn = sencode(v.file_name())
+        fn = v.file_name()
         line, column = v.rowcol(v.sel()[0].a)
         gotoline = -1
         if fn in ERRORS:
-            for errLine in ERRORS[fn]:
-                if errLine < line:
-                    gotoline = errLine
+            gotoline = ERRORS[fn].previous(line)
         if gotoline != -1:
-            v.window().open_file("%s:%d" % (fn, gotoline + 1), sublime.ENCODED_POSITION)
+            v.window().open_file(ERRORS[fn].position(fn, gotoline), sublime.ENCODED_POSITION)
         else:
             sublime.status_message("No more errors or warnings!")
 
 def clear_error_marks():
     global ERRORS
-    listdict = lambda: defaultdict(list)
-    ERRORS = defaultdict(listdict)
+    ERRORS = {}
 
 def has_error_marks(view):
-    fn = sencode(view.file_name())
-    return fn in ERRORS
+    return view.file_name() in ERRORS
 
 def clear_error_marks_view(filename):
-    global ERRORS
-    ERRORS[filename] = defaultdict(list)
+    ERRORS[filename] = ErrorStore()
 
-def add_error_mark(filename, line, message):
-    global ERRORS
+def add_error_mark(filename, line, message, column=None):
     if not filename in ERRORS:
-        ERRORS[filename] = defaultdict(list)
-    print(filename)
-    ERRORS[filename][line].append(message)
+        ERRORS[filename] = ErrorStore()
+    ERRORS[filename].add(line, message, column)
 
 def show_error_marks(view):
-    '''Adds error marks to view.'''
-    erase_error_marks(view)
-    outlines = []
-    fn = sencode(view.file_name())
+    '''Adds error marks to view. The marks are only redrawn if they changed
+    since they were last drawn.'''
+    store = ERRORS.get(view.file_name())
+    lines = tuple(store.lines) if store is not None else ()
+    drawn = (view.change_count(), lines)
+    if DRAWN.get(view.id()) == drawn:
+        return
+    if not lines:
+        erase_error_marks(view)
+        return
 
-    for line in ERRORS[fn].keys():
+    outlines = []
+    for line in lines:
         outlines.append(view.full_line(view.text_point(line, 0)))
 
     args = [
@@ -82,22 +114,23 @@ def show_error_marks(view):
         'dot'
     ]
     args.append(sublime.DRAW_OUTLINED)
+    # add_regions replaces the previous marks in one step.
     view.add_regions(*args)
+    DRAWN[view.id()] = drawn
 
 def erase_error_marks(view):
     view.erase_regions('gomode-outlines-illegal')
+    DRAWN.pop(view.id(), None)
 
 def last_selected_lineno(view):
     return view.rowcol(view.sel()[0].end())[0]
 
 def update_statusbar(view):
     fn = view.file_name()
-    if fn is not None:
-        fn = sencode(fn)
     lineno = last_selected_lineno(view)
 
-    if fn in ERRORS and lineno in ERRORS[fn]:
-        view.set_status('GoMode_line', "Error: %s" % '; '.join(ERRORS[fn][lineno]))
+    if fn in ERRORS and lineno in ERRORS[fn].messages:
+        view.set_status('GoMode_line', "Error: %s" % '; '.join(ERRORS[fn].messages[lineno]))
     else:
         view.erase_status('GoMode_line')
 
@@ -126,7 +159,7 @@ class GoStatusbarUpdater(sublime_plugin.EventListener):
         fn = view.file_name()
         if fn is None:
             return False
-        return sencode(fn) in ERRORS
+        return fn in ERRORS
 
     def show_errors(self, view):
         if self.has_errors(view) and not get_setting("error_marks_on_panel_only", False, view):
@@ -137,3 +170,6 @@ class GoStatusbarUpdater(sublime_plugin.EventListener):
 
     def on_load(self, view):
         self.show_errors(view)
+
+    def on_close(self, view):
+        DRAWN.pop(view.id(), None)
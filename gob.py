@@ -0,0 +1,335 @@
+# A minimal implementation of Go's encoding/gob wire format. It covers what
+# net/rpc needs to talk to the gocode daemon: the builtin scalar types, slices,
+# maps and structs. Interfaces and GobEncoder types are not supported.
+#
+# See http://golang.org/pkg/encoding/gob/ for the format description.
+
+import struct
+
+# Predefined type ids.
+BOOL = 1
+INT = 2
+UINT = 3
+FLOAT = 4
+BYTES = 5
+STRING = 6
+COMPLEX = 7
+INTERFACE = 8
+
+WIRE_TYPE = 16
+ARRAY_TYPE = 17
+COMMON_TYPE = 18
+SLICE_TYPE = 19
+STRUCT_TYPE = 20
+FIELD_TYPE = 21
+FIELD_TYPE_SLICE = 22
+MAP_TYPE = 23
+
+FIRST_USER_ID = 65
+
+class GobError(Exception):
+    pass
+
+class Slice:
+    def __init__(self, name, elem):
+        self.name = name
+        self.elem = elem
+
+class Map:
+    def __init__(self, name, key, elem):
+        self.name = name
+        self.key = key
+        self.elem = elem
+
+class Struct:
+    # fields is a list of (name, type) tuples, in declaration order.
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+# The types used to describe types on the wire.
+_common_type = Struct("CommonType", [("Name", STRING), ("Id", INT)])
+_field_type = Struct("fieldType", [("Name", STRING), ("Id", INT)])
+_wire_types = {
+    COMMON_TYPE: _common_type,
+    ARRAY_TYPE: Struct("arrayType", [("CommonType", COMMON_TYPE), ("Elem", INT), ("Len", INT)]),
+    SLICE_TYPE: Struct("sliceType", [("CommonType", COMMON_TYPE), ("Elem", INT)]),
+    STRUCT_TYPE: Struct("structType", [("CommonType", COMMON_TYPE), ("Field", FIELD_TYPE_SLICE)]),
+    FIELD_TYPE: _field_type,
+    FIELD_TYPE_SLICE: Slice("[]*fieldType", FIELD_TYPE),
+    MAP_TYPE: Struct("mapType", [("CommonType", COMMON_TYPE), ("Key", INT), ("Elem", INT)]),
+    WIRE_TYPE: Struct("wireType", [("ArrayT", ARRAY_TYPE), ("SliceT", SLICE_TYPE),
+                                   ("StructT", STRUCT_TYPE), ("MapT", MAP_TYPE)]),
+}
+
+def put_uint(buf, u):
+    if u < 0x80:
+        buf.append(u)
+        return
+    b = u.to_bytes((u.bit_length() + 7) // 8, 'big')
+    buf.append(256 - len(b))
+    buf.extend(b)
+
+def put_int(buf, i):
+    if i < 0:
+        put_uint(buf, (~i << 1) | 1)
+    else:
+        put_uint(buf, i << 1)
+
+def put_string(buf, s):
+    if isinstance(s, str):
+        s = s.encode('utf-8')
+    put_uint(buf, len(s))
+    buf.extend(s)
+
+def _is_zero(typ, value):
+    if isinstance(typ, Struct):
+        return False
+    return not value
+
+class Encoder:
+    '''Encodes values for a single gob stream. Type definitions are sent once
+    per stream, so an Encoder must not be shared between connections.'''
+
+    def __init__(self):
+        self.ids = {}
+        self.next_id = FIRST_USER_ID
+
+    def encode(self, typ, value):
+        out = bytearray()
+        tid = self._type_id(typ, out)
+        msg = bytearray()
+        put_int(msg, tid)
+        if not isinstance(typ, Struct):
+            # Top level non-struct values are sent as a singleton.
+            msg.append(0)
+        self._put_value(msg, typ, value)
+        put_uint(out, len(msg))
+        out.extend(msg)
+        return bytes(out)
+
+    def _type_id(self, typ, out):
+        if isinstance(typ, int):
+            return typ
+        tid = self.ids.get(id(typ))
+        if tid is not None:
+            return tid
+        tid = self.next_id
+        self.next_id += 1
+        self.ids[id(typ)] = tid
+
+        wire = bytearray()
+        if isinstance(typ, Struct):
+            fields = [(name, self._type_id(t, out)) for name, t in typ.fields]
+            put_uint(wire, 3) # StructT
+            put_uint(wire, 1) # CommonType
+            self._put_common(wire, typ.name, tid)
+            put_uint(wire, 1) # Field
+            put_uint(wire, len(fields))
+            for name, ftid in fields:
+                put_uint(wire, 1)
+                put_string(wire, name)
+                put_uint(wire, 1)
+                put_int(wire, ftid)
+                put_uint(wire, 0)
+            put_uint(wire, 0)
+        elif isinstance(typ, Slice):
+            elem = self._type_id(typ.elem, out)
+            put_uint(wire, 2) # SliceT
+            put_uint(wire, 1)
+            self._put_common(wire, typ.name, tid)
+            put_uint(wire, 1)
+            put_int(wire, elem)
+            put_uint(wire, 0)
+        elif isinstance(typ, Map):
+            key = self._type_id(typ.key, out)
+            elem = self._type_id(typ.elem, out)
+            put_uint(wire, 4) # MapT
+            put_uint(wire, 1)
+            self._put_common(wire, typ.name, tid)
+            put_uint(wire, 1)
+            put_int(wire, key)
+            put_uint(wire, 1)
+            put_int(wire, elem)
+            put_uint(wire, 0)
+        else:
+            raise GobError("cannot encode type %r" % (typ,))
+        put_uint(wire, 0) # end of wireType
+
+        msg = bytearray()
+        put_int(msg, -tid)
+        msg.extend(wire)
+        put_uint(out, len(msg))
+        out.extend(msg)
+        return tid
+
+    def _put_common(self, buf, name, tid):
+        put_uint(buf, 1)
+        put_string(buf, name)
+        put_uint(buf, 1)
+        put_int(buf, tid)
+        put_uint(buf, 0)
+
+    def _put_value(self, buf, typ, value):
+        if typ == BOOL:
+            put_uint(buf, 1 if value else 0)
+        elif typ == INT:
+            put_int(buf, value)
+        elif typ == UINT:
+            put_uint(buf, value)
+        elif typ == FLOAT:
+            put_uint(buf, int.from_bytes(struct.pack('<d', value), 'big'))
+        elif typ == BYTES or typ == STRING:
+            put_string(buf, value)
+        elif isinstance(typ, Struct):
+            last = -1
+            for i, (name, ftyp) in enumerate(typ.fields):
+                v = value.get(name)
+                if _is_zero(ftyp, v):
+                    continue
+                put_uint(buf, i - last)
+                last = i
+                self._put_value(buf, ftyp, v)
+            put_uint(buf, 0)
+        elif isinstance(typ, Slice):
+            put_uint(buf, len(value))
+            for v in value:
+                self._put_value(buf, typ.elem, v)
+        elif isinstance(typ, Map):
+            put_uint(buf, len(value))
+            for k in value:
+                self._put_value(buf, typ.key, k)
+                self._put_value(buf, typ.elem, value[k])
+        else:
+            raise GobError("cannot encode type %r" % (typ,))
+
+class _Reader:
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def byte(self):
+        if self.pos >= len(self.data):
+            raise GobError("unexpected end of message")
+        b = self.data[self.pos]
+        self.pos += 1
+        return b
+
+    def bytes(self, n):
+        if self.pos + n > len(self.data):
+            raise GobError("unexpected end of message")
+        b = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return b
+
+    def uint(self):
+        b = self.byte()
+        if b < 0x80:
+            return b
+        n = 256 - b
+        if n > 8:
+            raise GobError("invalid uint length %d" % n)
+        return int.from_bytes(self.bytes(n), 'big')
+
+    def int(self):
+        u = self.uint()
+        if u & 1:
+            return ~(u >> 1)
+        return u >> 1
+
+def read_uint(stream):
+    b = stream.read(1)
+    if not b:
+        raise EOFError()
+    b = b[0]
+    if b < 0x80:
+        return b
+    n = 256 - b
+    if n > 8:
+        raise GobError("invalid uint length %d" % n)
+    data = stream.read(n)
+    if len(data) != n:
+        raise EOFError()
+    return int.from_bytes(data, 'big')
+
+class Decoder:
+    '''Decodes values from a single gob stream. Structs are returned as dicts
+    keyed by field name; fields with zero values are absent.'''
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.types = dict(_wire_types)
+
+    def decode(self):
+        while True:
+            size = read_uint(self.stream)
+            data = self.stream.read(size)
+            if len(data) != size:
+                raise EOFError()
+            r = _Reader(data)
+            tid = r.int()
+            if tid < 0:
+                self.types[-tid] = self._wire_to_type(self._value(r, WIRE_TYPE))
+                continue
+            typ = self.types.get(tid, tid)
+            if not isinstance(typ, Struct):
+                if r.uint() != 0:
+                    raise GobError("invalid singleton for type %d" % tid)
+            return self._value(r, tid)
+
+    def _wire_to_type(self, wire):
+        if 'StructT' in wire:
+            t = wire['StructT']
+            fields = [(f.get('Name', ''), f.get('Id', 0)) for f in t.get('Field', [])]
+            return Struct(t['CommonType'].get('Name', ''), fields)
+        if 'SliceT' in wire:
+            t = wire['SliceT']
+            return Slice(t['CommonType'].get('Name', ''), t.get('Elem', 0))
+        if 'ArrayT' in wire:
+            t = wire['ArrayT']
+            return Slice(t['CommonType'].get('Name', ''), t.get('Elem', 0))
+        if 'MapT' in wire:
+            t = wire['MapT']
+            return Map(t['CommonType'].get('Name', ''), t.get('Key', 0), t.get('Elem', 0))
+        raise GobError("unsupported wire type %r" % (wire,))
+
+    def _value(self, r, tid):
+        if tid == BOOL:
+            return r.uint() != 0
+        if tid == INT:
+            return r.int()
+        if tid == UINT:
+            return r.uint()
+        if tid == FLOAT:
+            return struct.unpack('<d', r.uint().to_bytes(8, 'big'))[0]
+        if tid == COMPLEX:
+            re = struct.unpack('<d', r.uint().to_bytes(8, 'big'))[0]
+            im = struct.unpack('<d', r.uint().to_bytes(8, 'big'))[0]
+            return complex(re, im)
+        if tid == BYTES:
+            return bytes(r.bytes(r.uint()))
+        if tid == STRING:
+            return bytes(r.bytes(r.uint())).decode('utf-8', 'replace')
+
+        typ = self.types.get(tid)
+        if isinstance(typ, Struct):
+            value = {}
+            field = -1
+            while True:
+                delta = r.uint()
+                if delta == 0:
+                    return value
+                field += delta
+                if field >= len(typ.fields):
+                    raise GobError("field %d out of range for %s" % (field, typ.name))
+                name, ftid = typ.fields[field]
+                value[name] = self._value(r, ftid)
+        if isinstance(typ, Slice):
+            return [self._value(r, typ.elem) for i in range(r.uint())]
+        if isinstance(typ, Map):
+            value = {}
+            for i in range(r.uint()):
+                k = self._value(r, typ.key)
+                value[k] = self._value(r, typ.elem)
+            return value
+        raise GobError("cannot decode type id %d" % tid)
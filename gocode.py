@@ -0,0 +1,254 @@
+# A client for the gocode daemon. gocode speaks Go's net/rpc protocol with
+# gob encoding over a tcp socket, so we can talk to it directly rather than
+# spawning `gocode autocomplete` for every completion.
+import socket
+import subprocess
+import threading
+import time
+import re
+import bisect
+
+from . import gob
+from .common import *
+
+# The types must match the definitions in gocode's rpc.go and
+# net/rpc. gob matches struct fields by name, so only the names and the
+# shape of the types matter.
+_request = gob.Struct("Request", [("ServiceMethod", gob.STRING), ("Seq", gob.UINT)])
+
+_strings = gob.Slice("[]string", gob.STRING)
+
+_build_context = gob.Struct("go_build_context", [
+    ("GOARCH", gob.STRING),
+    ("GOOS", gob.STRING),
+    ("GOROOT", gob.STRING),
+    ("GOPATH", gob.STRING),
+    ("CgoEnabled", gob.BOOL),
+    ("UseAllFiles", gob.BOOL),
+    ("Compiler", gob.STRING),
+    ("BuildTags", _strings),
+    ("ReleaseTags", _strings),
+    ("InstallSuffix", gob.STRING),
+])
+
+_args_auto_complete = gob.Struct("Args_auto_complete", [
+    ("Arg0", gob.BYTES),
+    ("Arg1", gob.STRING),
+    ("Arg2", gob.INT),
+    ("Arg3", _build_context),
+])
+
+_args_close = gob.Struct("Args_close", [("Arg0", gob.INT)])
+
+# decl_class in gocode.
+CLASSES = ["const", "func", "import", "package", "type", "var"]
+
+def class_name(c):
+    if 0 <= c < len(CLASSES):
+        return CLASSES[c]
+    return ""
+
+class GoCodeError(Exception):
+    pass
+
+class _CountingReader:
+    def __init__(self, f):
+        self.f = f
+        self.count = 0
+
+    def read(self, n):
+        data = self.f.read(n)
+        self.count += len(data)
+        return data
+
+class _Connection:
+    def __init__(self, sock):
+        self.sock = sock
+        self.rfile = sock.makefile('rb')
+        self.reader = _CountingReader(self.rfile)
+        self.encoder = gob.Encoder()
+        self.decoder = gob.Decoder(self.reader)
+        self.seq = 0
+        # Bytes sent and read by the last call.
+        self.payload = 0
+
+    def call(self, method, args_type, args):
+        self.seq += 1
+        data = self.encoder.encode(_request, {"ServiceMethod": method, "Seq": self.seq})
+        data += self.encoder.encode(args_type, args)
+        self.sock.sendall(data)
+
+        self.reader.count = 0
+        response = self.decoder.decode()
+        reply = self.decoder.decode()
+        self.payload = len(data) + self.reader.count
+        if response.get("Seq", 0) != self.seq:
+            raise gob.GobError("unexpected sequence number %d" % response.get("Seq", 0))
+        if response.get("Error"):
+            raise GoCodeError(response["Error"])
+        return reply
+
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except socket.error:
+            pass
+
+def parse_address(addr):
+    # The address setting is in gocode's command line form, -addr=host:port.
+    if addr.startswith("-addr="):
+        addr = addr[len("-addr="):]
+    host, _, port = addr.rpartition(":")
+    return (host or "localhost", int(port))
+
+# The errors of a call on a connection whose daemon went away.
+_stale_errors = (EOFError, ConnectionResetError, ConnectionAbortedError, BrokenPipeError)
+
+class GoCodeClient:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.conn = None
+        self.context = None
+
+    def connect(self, timeout=None):
+        addr = parse_address(get_setting("gocode_address", "-addr=localhost:37777"))
+        if timeout is None:
+            timeout = get_setting("gocode_timeout", 5.0)
+        sock = socket.create_connection(addr, timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return _Connection(sock)
+
+    def probe(self, timeout=0.5):
+        '''Reports whether the daemon accepts connections.'''
+        try:
+            self.connect(timeout).close()
+            return True
+        except socket.error:
+            return False
+
+    def shutdown(self, timeout=1.0):
+        '''Asks the daemon listening on the address to exit. It uses a
+        connection of its own, so it doesn't wait for a call in flight.'''
+        try:
+            conn = self.connect(timeout)
+        except socket.error:
+            return
+        try:
+            conn.call("RPC.RPC_close", _args_close, {"Arg0": 0})
+        except (socket.error, EOFError, gob.GobError, GoCodeError):
+            # gocode may exit before it answers.
+            pass
+        finally:
+            conn.close()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+    def call(self, method, args_type, args, queued=None):
+        with self.lock:
+            start = time.time()
+            wait = start - queued if queued is not None else 0.0
+            status = 1
+            payload = 0
+            try:
+                # A reused connection may have gone stale if the daemon was
+                # restarted, so retry once with a fresh one. A timeout means
+                # gocode is slow rather than gone, and is not retried.
+                for attempt in range(2):
+                    reused = self.conn is not None
+                    if not reused:
+                        self.conn = self.connect()
+                    try:
+                        reply = self.conn.call(method, args_type, args)
+                        status = 0
+                        payload = self.conn.payload
+                        return reply
+                    except (socket.error, EOFError, gob.GobError) as e:
+                        self.conn.close()
+                        self.conn = None
+                        if not reused or not isinstance(e, _stale_errors):
+                            raise
+            finally:
+                stats.record("gocode", start, time.time() - start, status, payload, wait, get_setting("perf_trace_file"))
+
+    def build_context(self):
+        # gocode resolves packages using the client's build context. Ask the
+        # go tool for it once rather than on every request.
+        if self.context is not None:
+            return self.context
+        env = getenv()
+        context = {
+            "GOPATH": env.get("GOPATH", ""),
+            "GOROOT": env.get("GOROOT", ""),
+            "Compiler": "gc",
+        }
+        try:
+            p = openProcess(["go", "env", "GOARCH", "GOOS", "GOROOT", "CGO_ENABLED"], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = p.communicate()
+            values = stdout.decode('utf-8').splitlines()
+            if p.returncode == 0 and len(values) == 4:
+                context["GOARCH"], context["GOOS"], context["GOROOT"] = values[:3]
+                context["CgoEnabled"] = values[3] == "1"
+            p = openProcess(["go", "version"], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            stdout, stderr = p.communicate()
+            m = re.search(r'go1\.(\d+)', stdout.decode('utf-8'))
+            if m is not None:
+                context["ReleaseTags"] = ["go1.%d" % i for i in range(1, int(m.group(1)) + 1)]
+        except Exception as e:
+            print("cannot determine go build context: %s" % (e))
+        self.context = context
+        return context
+
+    def auto_complete(self, filename, src, cursor, queued=None):
+        '''Returns the candidates at the byte offset cursor in src, which must
+        be utf-8 encoded. Each candidate is a dict with Name, Type and Class
+        keys. queued is when the request was made, for the stats.'''
+        reply = self.call("RPC.RPC_auto_complete", _args_auto_complete, {
+            "Arg0": src,
+            "Arg1": filename,
+            "Arg2": cursor,
+            "Arg3": self.build_context(),
+        }, queued)
+        return reply.get("Arg0", [])
+
+client = GoCodeClient()
+
+class CompletionIndex:
+    '''The candidates gocode returned for an identifier start, indexed so that
+    the identifier being typed can be completed without asking gocode again.'''
+
+    def __init__(self, candidates):
+        self.candidates = sorted(candidates, key=lambda c: c.get("Name", "").lower())
+        self.keys = [c.get("Name", "").lower() for c in self.candidates]
+        self.completions = [self.completion(c) for c in self.candidates]
+
+    def completion(self, c):
+        name = c.get("Name", "")
+        cls = class_name(c.get("Class", 0))
+        typ = c.get("Type", "")
+        if cls == "func" and typ:
+            hint = typ
+        else:
+            hint = ("%s %s" % (cls, typ)).strip()
+        return ["%s\t%s" % (name, hint), name]
+
+    def filter(self, typed):
+        '''Returns the completions matching typed: prefix matches first, found
+        by bisection, then fuzzy (subsequence) matches.'''
+        if not typed:
+            return list(self.completions)
+        typed = typed.lower()
+        lo = bisect.bisect_left(self.keys, typed)
+        hi = bisect.bisect_left(self.keys, typed + "\U0010ffff", lo)
+        results = self.completions[lo:hi]
+        for i, key in enumerate(self.keys):
+            if lo <= i < hi:
+                continue
+            it = iter(key)
+            if all(ch in it for ch in typed):
+                results.append(self.completions[i])
+        return results
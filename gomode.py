@@ -5,8 +5,11 @@ import json
 import os
 import re
 import threading
+import collections
 import queue
 import atexit
+import hashlib
+import difflib
 
 #
 # TODO:
@@ -23,6 +26,16 @@ from .common import *
 
 from .thread_progress import *
 
+from . import gocode
+
+from .staging import stage
+
+from . import offsets
+
+from . import gotoken
+
+from . import symbols
+
 # Add flymake*.go so we avoid spamming the file view when flymaking.
 def update_file_exclude_patterns():
     s = sublime.load_settings("Preferences.sublime-settings")
@@ -39,7 +52,14 @@ def update_file_exclude_patterns():
         sublime.save_settings("Preferences.sublime-settings")
 update_file_exclude_patterns()
 
+# window id -> output view
+output_views = {}
+
 def get_output_view(window):
+    view = output_views.get(window.id())
+    if view is not None and view_is_valid(view):
+        return view
+
     view = None
     buff_name = 'Go Mode'
 
@@ -61,8 +81,49 @@ def get_output_view(window):
     view_settings.set('line_numbers', False)
     # view.set_syntax_file('Packages/GoMode/GoOracleResults.tmLanguage')
 
+    output_views[window.id()] = view
     return view
 
+class GoModeOutputWriter:
+    '''Collects text for the output views of all windows, from any thread,
+    and appends it in one edit per window at most every interval seconds.
+    The output views are capped at output_buffer_size characters, dropping
+    the oldest lines.'''
+
+    def __init__(self, interval=0.05):
+        self.lock = threading.Lock()
+        self.interval = interval
+        # window id -> (window, [text])
+        self.pending = {}
+        self.scheduled = False
+
+    def write(self, window, text):
+        if window is None:
+            return
+        with self.lock:
+            if window.id() not in self.pending:
+                self.pending[window.id()] = (window, [])
+            self.pending[window.id()][1].append(text)
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            sublime.set_timeout(self.flush, int(self.interval * 1000))
+
+    # Run in main thread.
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.scheduled = False
+        limit = get_setting("output_buffer_size", 1000000)
+        for window, texts in pending.values():
+            text = ''.join(texts)
+            if limit > 0 and len(text) > limit:
+                text = text[len(text) - limit:]
+            get_output_view(window).run_command('go_mode_output_insert', {'text': text, 'limit': limit})
+
+output = GoModeOutputWriter()
+
 def sel(view, i=0):
     try:
         s = view.sel()
@@ -101,30 +162,266 @@ packages = {
 
 import time
 
-def install_packages(view):
-    for k in packages:
-        view.run_command('go_mode_output_insert', {'text': "Installing %s\n" % (k)})
-        args = ["go", "get", "-u", "-v", "-f", packages[k] ]
-        view.run_command('go_mode_output_insert', {'text': " ".join(args)})
-        view.run_command('go_mode_output_insert', {'text': "\n"})
-        try:
-            env = getenv()
-            child = openProcess(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = child.communicate()
+def find_binary(name, env):
+    exe = name
+    if os.name == 'nt':
+        exe += ".exe"
+    dirs = [os.path.join(p, "bin") for p in env.get("GOPATH", "").split(os.pathsep) if p]
+    dirs += env.get("PATH", "").split(os.pathsep)
+    for d in dirs:
+        if os.path.isfile(os.path.join(d, exe)):
+            return os.path.join(d, exe)
+    return None
+
+def package_dir(path, env):
+    for p in env.get("GOPATH", "").split(os.pathsep):
+        d = os.path.join(p, "src", path)
+        if p and os.path.isdir(d):
+            return d
+    return None
+
+def package_revision(path, env):
+    d = package_dir(path, env)
+    if d is None:
+        return None
+    p = openProcess(["git", "rev-parse", "HEAD"], cwd=d, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stdout, stderr = p.communicate()
+    if p.returncode != 0:
+        return None
+    return stdout.decode('utf-8').strip()
+
+def install_package(window, name, path, revision, force, env):
+    def write(text):
+        lines = ["[%s] %s" % (name, l) for l in text.splitlines(True)]
+        output.write(window, ''.join(lines))
+    out = OutputStream(write)
+
+    # Skip binaries that are already installed at the requested revision.
+    if not force and find_binary(name, env) is not None:
+        if revision is None:
+            out.add("already installed\n")
+            out.close()
+            return
+        current = package_revision(path, env)
+        if current is not None and current.startswith(revision):
+            out.add("already installed at %s\n" % (revision))
+            out.close()
+            return
+
+    steps = [(["go", "get", "-u", "-v", "-f", path], None)]
+    if revision is not None:
+        steps = [(["go", "get", "-d", "-u", "-v", "-f", path], None),
+                 (["git", "checkout", "-q", revision], path),
+                 (["go", "install", "-v", path], None)]
+    try:
+        for args, cwd in steps:
+            out.add(" ".join(args) + "\n")
+            if cwd is not None:
+                cwd = package_dir(cwd, env)
+            child = openProcess(args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            for data in iter(lambda: child.stdout.read1(65536), b''):
+                child.payload += len(data)
+                out.feed(data)
+            child.wait()
             if child.returncode != 0:
-                err = stderr.decode('utf-8')
-                view.run_command('go_mode_output_insert', {'text': "Failed %s\n" % (err)})
-            view.run_command('go_mode_output_insert', {'text': stdout.decode('utf-8')})
-            view.run_command('go_mode_output_insert', {'text': "\n"})
-        except Exception as e:
-            view.run_command('go_mode_output_insert', {'text': "Failed %s\n" % (e)})
+                out.add("Failed with exit status %d\n" % (child.returncode))
+                break
+        else:
+            out.add("installed\n")
+    except Exception as e:
+        out.add("Failed %s\n" % (e))
+    out.close()
+
+def install_packages(window, force=False):
+    env = getenv()
+    revisions = get_setting("install_revisions", {})
+
+    # Tools from the same repository are installed one after the other, so
+    # go get doesn't update a repository from two processes at once.
+    groups = collections.OrderedDict()
+    for k in sorted(packages):
+        repo = "/".join(packages[k].split("/")[:3])
+        groups.setdefault(repo, []).append(k)
+    jobs = queue.Queue()
+    for repo in groups:
+        jobs.put(groups[repo])
+
+    def work():
+        while True:
+            try:
+                group = jobs.get_nowait()
+            except queue.Empty:
+                return
+            for k in group:
+                install_package(window, k, packages[k], revisions.get(k), force, env)
+
+    workers = []
+    for i in range(max(1, min(get_setting("install_concurrency", max(cpu_count(), 4)), len(groups)))):
+        t = threading.Thread(target=work)
+        t.start()
+        workers.append(t)
+    for t in workers:
+        t.join()
 
 class GoModeInstallBinaries(sublime_plugin.WindowCommand):
-    def run(self):
-            t = threading.Thread(target=install_packages, args=(get_output_view(self.window),))
+    def run(self, force=False):
+            get_output_view(self.window)
+            t = threading.Thread(target=install_packages, args=(self.window, force))
             t.start()
             ThreadProgress(t, "installing binaries", "installing GoMode binaries complete")
 
+def show_output(window):
+    view = get_output_view(window)
+    if get_setting("output", "buffer") == "output_panel":
+        window.run_command("show_panel", {"panel": "output.Go Mode"})
+    else:
+        window.focus_view(view)
+
+class GoModeShowPerformanceStats(sublime_plugin.WindowCommand):
+    def run(self):
+        output.write(self.window, stats.report())
+        show_output(self.window)
+
+def content_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+# Trailing whitespace doesn't change what the compiler reports.
+trailing_whitespace_re = re.compile(r'[ \t]+$', re.MULTILINE)
+
+def flymake_key(filename, data):
+    '''Returns the key flymake results are memoized under: a hash of the
+    buffer, ignoring trailing whitespace, and of the names, sizes and mtimes
+    of the other files in the package.'''
+    h = hashlib.sha1(trailing_whitespace_re.sub('', data).encode('utf-8'))
+    dirname = os.path.dirname(filename)
+    for name in sorted(os.listdir(dirname)):
+        if not name.endswith('.go') or name.startswith('flymake_'):
+            continue
+        path = os.path.join(dirname, name)
+        if path == filename:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        h.update(('%s:%d:%d;' % (name, st.st_size, st.st_mtime)).encode('utf-8'))
+    return h.digest()
+
+# view id -> (input hash, output hash, output) of the last goimports run.
+format_memo = {}
+
+def split_lines(text):
+    # Sublime only breaks lines on \n.
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [l + '\n' for l in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+def replace_changed(view, edit, old, new):
+    '''Replaces the content of view, which is old, with new by only editing
+    the lines that differ.'''
+    a = split_lines(old)
+    b = split_lines(new)
+    starts = [0]
+    for l in a:
+        starts.append(starts[-1] + len(l))
+    matcher = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    # Apply the hunks from the end so the offsets of earlier ones hold.
+    for tag, i1, i2, j1, j2 in reversed(matcher.get_opcodes()):
+        if tag == 'equal':
+            continue
+        text = ''.join(b[j1:j2])
+        if tag == 'insert':
+            view.insert(edit, starts[i1], text)
+        else:
+            view.replace(edit, sublime.Region(starts[i1], starts[i2]), text)
+
+def run_formatter(args, content):
+    '''Returns the output of the formatter run with content as its input, or
+    None if it failed or did not finish in time.'''
+    env = getenv()
+    child = openProcess(args, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    timeout = get_setting("format_timeout", 5)
+    try:
+        stdout, stderr = child.communicate(input=content.encode('utf-8'), timeout=timeout or None)
+    except subprocess.TimeoutExpired:
+        child.kill()
+        child.communicate()
+        print("%s timed out after %ss" % (args[0], timeout))
+        return None
+    if child.returncode != 0:
+        err = stderr.decode('utf-8')
+        print("%s failed: %s" % (args[0], err))
+        return None
+    return stdout.decode('utf8')
+
+def needs_goimports(content):
+    '''Reports whether the imports of content may need to change: an import
+    whose package is not used, or a qualifier that is not imported and not
+    declared at the package level or in the blocks around it. goimports
+    scans the GOPATH, so it is only run when this says so; plain gofmt does
+    the rest. The check errs on the side of running goimports.'''
+    try:
+        tokens = list(gotoken.tokenize(content))
+        imports, i = gotoken.parse_imports(tokens)
+        package, decls = gotoken.parse_declarations(content, tokens)
+    except ValueError:
+        return True
+
+    names = set()
+    for name, path in imports:
+        if name == "_" or name == ".":
+            continue
+        if name is None:
+            name = gotoken.assumed_name(path)
+        names.add(name)
+    declared = set(d[0] for d in decls if d[1] != gotoken.METHOD)
+
+    used = set()
+    # The tokens of the top level declaration so far, less the blocks that
+    # are closed, which is where the declarations in scope are.
+    visible = []
+    blocks = []
+    depth = 0
+    # qualifier -> (len(visible), bound) as of its last check in the
+    # current blocks.
+    checked = {}
+    for j in range(i, len(tokens)):
+        kind, text, pos = tokens[j]
+        if text in ("(", "[", "{"):
+            depth += 1
+        elif text in (")", "]", "}"):
+            depth -= 1
+        if depth == 0 and text in ("func", "var", "const", "type"):
+            visible = []
+            blocks = []
+            checked = {}
+        if text == "{":
+            blocks.append(len(visible))
+        elif text == "}" and blocks:
+            del visible[blocks.pop():]
+            checked = {}
+            continue
+        visible.append(tokens[j])
+        if kind != gotoken.IDENT:
+            continue
+        if not (j + 2 < len(tokens) and tokens[j + 1][1] == "." and tokens[j + 2][0] == gotoken.IDENT and tokens[j - 1][1] != "."):
+            continue
+        if text in names:
+            used.add(text)
+            continue
+        if text in declared:
+            continue
+        state = checked.get(text)
+        if state is None or (not state[1] and state[0] != len(visible)):
+            state = (len(visible), symbols.bound_locally(visible, text))
+            checked[text] = state
+        if not state[1]:
+            return True
+    return bool(names - used)
+
 class GoModeGoFmtCommand(sublime_plugin.TextCommand):
     def is_enabled(self):
         return is_go_source_view(self.view)
@@ -133,29 +430,172 @@ class GoModeGoFmtCommand(sublime_plugin.TextCommand):
         # Get the content of the current window from the text editor.
         selection = sublime.Region(0, self.view.size())
         content = self.view.substr(selection)
+        h = content_hash(content)
 
-        try:
-            env = getenv()
-            child = openProcess(["goimports"], env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = child.communicate(input=content.encode('utf-8'))
-            if child.returncode != 0:
-                err = stderr.decode('utf-8')
-                print("goimports failed: %s" % (err))
+        # Skip goimports if the buffer is what it produced last time, or
+        # reuse its output if the buffer is what it was given last time.
+        memo = format_memo.get(self.view.id())
+        if memo is not None and h == memo[1]:
+            return
+        if memo is not None and h == memo[0]:
+            output = memo[2]
+        else:
+            args = ["goimports"]
+            if get_setting("format_fast_path", True, self.view) and not needs_goimports(content):
+                args = ["gofmt"]
+            try:
+                output = run_formatter(args, content)
+            except Exception as e:
+                print(e)
                 return
+            if output is None:
+                return
+            format_memo[self.view.id()] = (h, content_hash(output), output)
 
-            # Put the result back.
-            self.view.replace(edit, selection, stdout.decode('utf8'))
-        except Exception as e:
-            print(e)
+        # Put the result back.
+        replace_changed(self.view, edit, content, output)
+        offsets.invalidate(self.view)
 
 class GoModeOutputInsertCommand(sublime_plugin.TextCommand):
-    def run(self, edit, text):
+    def run(self, edit, text, limit=0):
         self.view.insert(edit, self.view.size(), text)
+        # Drop whole lines from the start to keep the view under limit.
+        if limit > 0 and self.view.size() > limit:
+            cut = self.view.full_line(self.view.size() - limit).end()
+            self.view.erase(edit, sublime.Region(0, cut))
+
+class GoModeRenamer:
+    '''Runs one gorename at a time in the background. A rename can be
+    previewed as a diff before it is made, and cancelled while it runs.
+    Afterwards the open views of the files it changed are reloaded at
+    once.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = False
+        self.proc = None
+
+    def running(self):
+        with self.lock:
+            return self.active
+
+    def cancel(self):
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                return False
+            self.proc.stopped = True
+            self.proc.kill()
+            return True
+
+    def start(self, window, args, preview, files):
+        '''Runs gorename with args. files are the open files, to reload
+        those it changes.'''
+        with self.lock:
+            if self.active:
+                return False
+            self.active = True
+        t = threading.Thread(target=self.run, args=(window, args, preview, files))
+        t.daemon = True
+        t.result = False
+        if preview:
+            ThreadProgress(t, "gorename -d", "gorename diff ready")
+        else:
+            ThreadProgress(t, "gorename", "gorename done")
+        t.start()
+        return True
+
+    # Run in rename thread.
+    def gorename(self, args):
+        '''Returns the exit status, stdout and stderr of gorename. The exit
+        status is None if it was cancelled.'''
+        with self.lock:
+            proc = openProcess(["gorename"] + args, env=getenv(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            proc.stopped = False
+            self.proc = proc
+        try:
+            stdout, stderr = proc.communicate()
+        finally:
+            with self.lock:
+                self.proc = None
+        returncode = None if proc.stopped else proc.returncode
+        return returncode, stdout.decode('utf-8', 'replace'), stderr.decode('utf-8', 'replace')
+
+    # Run in rename thread.
+    def run(self, window, args, preview, files):
+        confirm = False
+        try:
+            if preview:
+                args = ["-d"] + args
+            else:
+                before = dict((f, file_state(f)) for f in files)
+            try:
+                returncode, stdout, stderr = self.gorename(args)
+            except Exception as e:
+                output.write(window, "go rename not found: %s\n" % (e))
+                sublime.set_timeout(lambda: show_output(window), 0)
+                return
+            if returncode is None:
+                sublime.set_timeout(lambda: sublime.status_message("gorename cancelled"), 0)
+                return
+            if returncode != 0:
+                output.write(window, "go rename failed\n%s%s\n" % (stdout, stderr))
+                sublime.set_timeout(lambda: show_output(window), 0)
+                return
+            threading.current_thread().result = True
+            if preview:
+                output.write(window, "%s\n" % (stdout))
+                confirm = True
+                return
+            changed = [f for f in files if file_state(f) != before[f]]
+            output.write(window, stderr)
+            sublime.set_timeout(lambda: reload_files(window, changed), 0)
+        finally:
+            with self.lock:
+                self.active = False
+            if confirm:
+                sublime.set_timeout(lambda: self.confirm(window, args[1:], files), 0)
+
+    # Run in main thread.
+    def confirm(self, window, args, files):
+        show_output(window)
+        if sublime.ok_cancel_dialog("Rename as shown in the Go Mode output?", "Rename"):
+            self.start(window, args, False, files)
+
+renamer = GoModeRenamer()
+
+def file_state(filename):
+    '''Returns the size, mtime and content hash of filename. The hash
+    catches rewrites of the same size within the mtime's resolution, which
+    is a second on some filesystems.'''
+    try:
+        st = os.stat(filename)
+        with open(filename, 'rb') as f:
+            digest = hashlib.sha1(f.read()).digest()
+    except (IOError, OSError):
+        return None
+    return (st.st_size, st.st_mtime, digest)
+
+# Run in main thread.
+def reload_files(window, changed):
+    '''Reloads the views of the files in changed, in all windows. Views
+    with unsaved changes are left alone.'''
+    dirty = []
+    for f in changed:
+        for view in views_of(f):
+            if view.is_dirty():
+                dirty.append(f)
+            else:
+                view.run_command("revert")
+    if dirty:
+        output.write(window, "not reloaded, as they have unsaved changes:\n%s\n" % ("\n".join(sorted(set(dirty)))))
+        show_output(window)
 
 class GoModeGoRenameCommand(sublime_plugin.WindowCommand):
-    def run(self):
+    def run(self, preview=None):
         view = self.window.active_view()
         filename = view.file_name()
+        if preview is None:
+            preview = get_setting("rename_preview", False, view)
 
         region = view.sel()[0]
         if region.empty():
@@ -172,23 +612,26 @@ class GoModeGoRenameCommand(sublime_plugin.WindowCommand):
         def on_done(new_name):
             if new_name == current_selection:
                 return
-            try:
-                offset = filename + ':#{0}'.format(region.begin())
-                env = getenv()
-                args = ['gorename', '-offset', offset, '-to', new_name]
-                p = openProcess(args, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                stdout, stderr = p.communicate()
-                if p.returncode != 0:
-                    view = get_output_view(self.window)
-                    self.window.focus_view(view)
-                    view.run_command('go_mode_output_insert', {'text': "go rename failed\n%s\n" % (str(e))})
-            except Exception as e:
-                view = get_output_view(self.window)
-                self.window.focus_view(view)
-                view.run_command('go_mode_output_insert', {'text': "go rename not found: %s\n" % (e)})
+            offset = filename + ':#{0}'.format(offsets.byte_offset(view, region.begin()))
+            files = set()
+            for window in sublime.windows():
+                for v in window.views():
+                    # gorename only rewrites Go files.
+                    if v.file_name() is not None and v.file_name().endswith(".go"):
+                        files.add(v.file_name())
+            if not renamer.start(self.window, ['-offset', offset, '-to', new_name], preview, sorted(files)):
+                sublime.status_message("gorename is already running")
 
         self.window.show_input_panel("New name:", current_selection, on_done, None, None)
 
+class GoModeGoRenameCancelCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        if not renamer.cancel():
+            sublime.status_message("gorename is not running")
+
+    def is_enabled(self):
+        return renamer.running()
+
 
 navigation_stack = []
 
@@ -217,9 +660,16 @@ class GoModeGoDefCommand(sublime_plugin.WindowCommand):
         try:
             view = self.window.active_view()
             select = view.sel()[0]
-            string_before = view.substr(sublime.Region(0, select.begin()))
-            string_before.encode("utf-8")
-            offset = len(bytearray(string_before, encoding = "utf8"))
+
+            # Package level identifiers are found in the symbol index, the
+            # rest is left to godef.
+            if get_setting("symbol_index", True, view):
+                target = symbols.definition(view, select.begin())
+                if target is not None:
+                    navigation_stack_open(view, target)
+                    return
+
+            offset = offsets.byte_offset(view, select.begin())
 
             filename = view.file_name()
 
@@ -238,46 +688,199 @@ class GoModeGoDefCommand(sublime_plugin.WindowCommand):
         except Exception as e:
             print(e)
 
-def log_output(out, view):
+class GoModeGoToSymbolCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        view = self.window.active_view()
+        if not get_setting("symbol_index", True, view):
+            sublime.status_message("GoMode: the symbol index is turned off by the symbol_index setting")
+            return
+        if symbols.index.stale(get_setting("symbol_index_interval", 300, view)):
+            symbols.index.refresh(symbols.index_roots(self.window, view))
+        first = None
+        if view is not None and view.file_name() is not None:
+            first = os.path.dirname(view.file_name())
+        items = symbols.index.symbols(first)
+        if not items:
+            sublime.status_message("GoMode: no symbols indexed yet")
+            return
+
+        def on_done(i):
+            if i < 0:
+                return
+            if view is not None and view.file_name() is not None:
+                navigation_stack_open(view, items[i][2])
+            else:
+                self.window.open_file(items[i][2], sublime.ENCODED_POSITION)
+
+        self.window.show_quick_panel([[label, description] for label, description, location in items], on_done)
+
+def log_output(out, window):
     for line in iter(out.readline, b''):
-        view.run_command('go_mode_output_insert', {'text': line.decode('utf-8') })
+        output.write(window, line.decode('utf-8'))
 
 class GoModeGoCodeDaemon:
+    '''Runs the gocode daemon and keeps it running. A supervisor thread
+    starts gocode, lets completions through once it accepts connections,
+    restarts it with backoff when it exits, and after each start warms up
+    its package cache with a query for each package open in a view.'''
+
     def __init__(self):
+        self.cond = threading.Condition()
         self.p = None
+        self.ready = False
+        self.restart = False
+        self.stopping = False
+        self.worker = None
 
     def fork_gocode(self):
-        print("fork_gocode")
-        kill_gocode()
+        '''Starts gocode, or restarts it if it is running.'''
+        with self.cond:
+            self.restart = True
+            self.stopping = False
+            p = self.p
+            # The supervisor clears worker when it stops.
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.daemon = True
+                self.worker.start()
+            self.cond.notify_all()
+        if p is not None and p.poll() is None:
+            p.terminate()
 
-        outputView = get_output_view(sublime.active_window())
+    def kill_gocode(self):
+        '''Stops gocode without waiting for it to exit.'''
+        with self.cond:
+            self.stopping = True
+            self.ready = False
+            p = self.p
+            self.cond.notify_all()
+        if p is not None and p.poll() is None:
+            p.terminate()
+
+    def wait_ready(self, timeout):
+        '''Waits until gocode accepts connections, and reports whether it
+        does.'''
+        with self.cond:
+            return self.cond.wait_for(lambda: self.ready or self.stopping, timeout) and self.ready
+
+    # Run in supervisor thread.
+    def run(self):
+        delay = 0.0
+        while True:
+            with self.cond:
+                if self.stopping:
+                    self.worker = None
+                    return
+                self.restart = False
+            started = time.time()
+            p = self.start()
+            if p is not None:
+                if self.wait_started(p):
+                    with self.cond:
+                        self.ready = True
+                        self.cond.notify_all()
+                    if get_setting("gocode_warm_up", True):
+                        sublime.set_timeout(self.warm_up, 0)
+                p.wait()
+            with self.cond:
+                self.ready = False
+                self.p = None
+                if self.stopping:
+                    self.worker = None
+                    return
+                if self.restart:
+                    delay = 0.0
+                    continue
+            # It crashed. Back off, unless it had been up for a while.
+            if time.time() - started > 60:
+                delay = 0.0
+            delay = min(max(2 * delay, 0.5), 30.0)
+            window = sublime.active_window()
+            code = p.returncode if p is not None else None
+            output.write(window, "gocode exited (%s), restarting in %.1fs\n" % (code, delay))
+            with self.cond:
+                self.cond.wait_for(lambda: self.restart or self.stopping, delay)
+
+    # Run in supervisor thread.
+    def start(self):
+        window = sublime.active_window()
+        # A daemon left over from an earlier session holds the address.
+        gocode.client.shutdown()
+        gocode.client.close()
         env = getenv()
         try:
             addr = get_setting("gocode_address", "-addr=localhost:37777")
             debug = get_setting("gocode_debug", "false")
-            # XXX: Parameterize gocode addr.
-            self.p = openProcess(["gocode", "-sock=tcp", addr, "-s=true", "-debug=%s" % (debug)], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            t = threading.Thread(target=log_output, args=(self.p.stdout, outputView))
-            t.daemon = True # thread dies with the program
-            t.start()
-            t = threading.Thread(target=log_output, args=(self.p.stderr, outputView))
+            p = openProcess(["gocode", "-sock=tcp", addr, "-s=true", "-debug=%s" % (debug)], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except Exception as e:
+            output.write(window, "cannot fork gocode\n%s\n" % (e))
+            return None
+        # The daemon's lifetime is no tool run; the client records the calls.
+        p.recorded = True
+        with self.cond:
+            self.p = p
+            stopping = self.stopping
+        if stopping:
+            p.terminate()
+        for out in (p.stdout, p.stderr):
+            t = threading.Thread(target=log_output, args=(out, window))
             t.daemon = True # thread dies with the program
             t.start()
+        return p
+
+    # Run in supervisor thread.
+    def wait_started(self, p, timeout=10.0):
+        deadline = time.time() + timeout
+        interval = 0.01
+        while p.poll() is None and time.time() < deadline:
+            if gocode.client.probe():
+                return True
+            time.sleep(interval)
+            interval = min(2 * interval, 0.2)
+        if p.poll() is None:
+            output.write(sublime.active_window(), "gocode did not start listening in %.0fs\n" % (timeout))
+            p.terminate()
+        return False
 
-        except Exception as e:
-            outputView.run_command('go_mode_output_insert', {'text': "cannot fork gocode\n%s" % (e) })
+    # Run in main thread.
+    def warm_up(self):
+        # One query per package directory, with the buffer as it is.
+        queries = collections.OrderedDict()
+        for window in sublime.windows():
+            for view in window.views():
+                filename = view.file_name()
+                if filename is None or not filename.endswith(".go"):
+                    continue
+                dirname = os.path.dirname(filename)
+                if dirname in queries:
+                    continue
+                src = view.substr(sublime.Region(0, view.size())).encode('utf-8')
+                queries[dirname] = (filename, src)
+        if not queries:
+            return
+        generation = completion_requests.generation
 
-    def kill_gocode(self):
-        env = getenv()
-        addr = get_setting("gocode_address", "-addr=localhost:37777")
-        p = openProcess(["gocode", "-sock=tcp", addr, "close"], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        stdout, stderr = p.communicate()
-        if p.returncode != 0:
-            if not self.p is None:
-                self.p.terminate()
-        if not self.p is None:
-            self.p.wait()
-            self.p = None
+        def run():
+            # A connection of its own, so that completions don't queue
+            # behind the warm up on the client's.
+            client = gocode.GoCodeClient()
+            client.context = gocode.client.build_context()
+            try:
+                for filename, src in queries.values():
+                    with self.cond:
+                        if not self.ready:
+                            return
+                    # The user asked for completions; gocode is theirs now.
+                    if completion_requests.generation != generation:
+                        return
+                    client.auto_complete(filename, src, len(src))
+            except Exception as e:
+                print("gocode warm up failed: %s" % (e))
+            finally:
+                client.close()
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
 
 daemon = GoModeGoCodeDaemon()
 sublime.set_timeout(lambda: daemon.fork_gocode(), 0)
@@ -286,172 +889,474 @@ def kill_gocode():
     daemon.kill_gocode()
 atexit.register(kill_gocode)
 
+def plugin_unloaded():
+    # Otherwise the supervisor of the unloaded module and that of the
+    # reloaded one would each take the other's gocode for a crash.
+    kill_gocode()
+
 class GoModeRestartGoCode(sublime_plugin.WindowCommand):
     def run(self):
         daemon.fork_gocode()
 
+class GoModeCompletionRequests:
+    '''Runs completion queries on a background thread. Only the newest
+    request is kept: a pending request is replaced by a newer one, and the
+    result of a request that is still in flight when a newer one arrives is
+    dropped. A request that fails passes None to its callback.'''
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.pending = None
+        self.generation = 0
+        self.worker = None
+
+    def submit(self, query, callback):
+        with self.cond:
+            self.generation += 1
+            self.pending = (self.generation, query, callback)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.daemon = True
+                self.worker.start()
+            self.cond.notify()
+
+    def is_current(self, generation):
+        with self.cond:
+            return generation == self.generation
+
+    # Run in worker thread.
+    def run(self):
+        while True:
+            with self.cond:
+                while self.pending is None:
+                    self.cond.wait()
+                (generation, query, callback) = self.pending
+                self.pending = None
+            try:
+                result = query()
+            except Exception as e:
+                print("gocode failed: %s" % (e))
+                # The callback gets None, so that the request can be made
+                # again.
+                result = None
+            if self.is_current(generation):
+                sublime.set_timeout(lambda generation=generation, callback=callback, result=result: callback(generation, result), 0)
+
+completion_requests = GoModeCompletionRequests()
+
+# The identifier that ends at the cursor.
+identifier_re = re.compile(r'\w*$')
+
+def identifier_start(view, pos):
+    before = view.substr(sublime.Region(max(0, pos - 256), pos))
+    return pos - len(identifier_re.search(before).group(0))
+
 class GoModeAutocomplete(sublime_plugin.EventListener):
+    def __init__(self):
+        # view id -> (identifier start, context hash, gocode.CompletionIndex).
+        # The context is the buffer outside of the identifier being typed, so
+        # further characters of the same identifier are answered from the
+        # cache.
+        self.cache = {}
+        self.inflight = None
+
     def on_query_completions(self, view, prefix, locations):
-        results = []
-        try:
-            pos = locations[0]
-            env = getenv()
-            p = openProcess(["gocode", "-sock=tcp", "-addr=localhost:37777", "-f=json", "autocomplete", view.file_name().encode('utf-8'), str(pos)], env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            src = view.substr(sublime.Region(0, view.size()))
-            stdout, stderr = p.communicate(input=src.encode())
-            if p.returncode != 0:
-                err = stderr.decode('utf-8')
-                print("gocode failed: %s" % (err))
-                return []
+        if not is_go_source_view(view):
+            return []
+
+        pos = locations[0]
+        start = identifier_start(view, pos)
+        src = view.substr(sublime.Region(0, view.size()))
+        typed = src[start:pos]
+        h = hashlib.sha1(src[:start].encode('utf-8'))
+        h.update(b'\0')
+        h.update(src[pos:].encode('utf-8'))
+        key = (view.id(), start, h.digest())
+
+        entry = self.cache.get(view.id())
+        if entry is not None and entry[:2] == key[1:]:
+            return entry[2].filter(typed)
+        if self.inflight == key:
+            return []
+        self.inflight = key
+
+        # Ask gocode for everything at the start of the identifier, in the
+        # background, and refresh the view once the results are in.
+        filename = view.file_name() or ""
+        context = src[:start] + src[pos:]
+        # gocode wants the cursor as a byte offset.
+        cursor = offsets.byte_offset(view, start)
+
+        queued = time.time()
+
+        def query():
+            # gocode may be starting or restarting.
+            if not daemon.wait_ready(get_setting("gocode_timeout", 5.0)):
+                raise gocode.GoCodeError("gocode is not running")
+            candidates = gocode.client.auto_complete(filename, context.encode('utf-8'), cursor, queued)
+            return gocode.CompletionIndex(candidates)
+
+        def done(generation, index):
+            if self.inflight == key:
+                self.inflight = None
+            if index is None:
+                return
+            # Drop responses for a request that was superseded.
+            if not completion_requests.is_current(generation):
+                return
+            self.cache[view.id()] = key[1:] + (index,)
+            # Only refresh if the cursor is still in the same identifier.
+            cursor = sel(view).b
+            if cursor < start or identifier_start(view, cursor) != start:
+                return
+            view.run_command('hide_auto_complete')
+            view.run_command('auto_complete', {
+                'disable_auto_insert': True,
+                'next_completion_if_showing': False})
 
-            try:
-                j = json.loads(stdout.decode("utf8"))
-            except ValueError:
-                print("Not valid JSON")
-                return []
-
-            if len(j) == 2:
-                for r in j[1]:
-                    #results.append(['trigger': r['name'], 'contents': r['name']])
-                    results.append([ r['name'], r['name']])
-        except Exception as e:
-            print(e)
-        return results
+        completion_requests.submit(query, done)
+        return []
+
+    def on_close(self, view):
+        self.cache.pop(view.id(), None)
+        format_memo.pop(view.id(), None)
+        forget_view(view)
 
     def on_pre_save(self, view):
         view.run_command("go_mode_go_fmt")
 
-class GoModeCompiler:
-    def __init__(self):
+# goflymake reports file:line:col: message when building tests, and
+# file:line: message otherwise.
+diagnostic_re = re.compile(r'^([^:\n]+):(\d+):(?:(\d+):)? (.*)$', re.M)
+
+def views_of(filename):
+    '''Returns the views of filename in all windows.'''
+    result = []
+    for window in sublime.windows():
+        view = window.find_open_file(filename)
+        if view is not None:
+            result.append(view)
+    return result
+
+class GoModeDiagnostics:
+    '''Parses the output of the goflymake build of filename as it is read, on
+    any thread, and hands the errors to the main thread in batches, at most
+    every interval seconds. The errors are marked in the file they are in,
+    filename or another file of its package. The marks of the last build of
+    filename are replaced on the first batch.'''
+
+    def __init__(self, compiler, filename, view, interval=0.05):
+        self.compiler = compiler
+        self.filename = filename
+        self.dirname = os.path.dirname(filename)
+        self.view = view
+        self.interval = interval
         self.lock = threading.Lock()
-        self.targets = {}
-        self.queue = queue.Queue(maxsize=0)
-        self.worker = threading.Thread(target=self.do_compile)
-        self.worker.setDaemon(True)
-        self.worker.start()
-        self.recompile_timer = None
-        self.recompile_delay = 0.1
+        self.partial = b''
+        # [(text, [(filename, line, column, message)])]
+        self.pending = []
+        self.scheduled = False
+        self.started = False
+        self.reported = set()
+
+    def feed(self, data):
+        data = self.partial + data
+        i = data.rfind(b'\n')
+        if i < 0:
+            self.partial = data
+            return
+        self.partial = data[i + 1:]
+        self.add(data[:i + 1].decode('utf-8', 'replace'))
+
+    def add(self, text):
+        errors = []
+        for m in diagnostic_re.finditer(text):
+            base = os.path.basename(m.group(1))
+            if base.startswith("flymake_"):
+                base = base[len("flymake_"):]
+            column = int(m.group(3)) - 1 if m.group(3) else None
+            errors.append((os.path.join(self.dirname, base), int(m.group(2)) - 1, column, m.group(4)))
+        with self.lock:
+            self.pending.append((text, errors))
+            schedule = not self.scheduled
+            self.scheduled = True
+        if schedule:
+            sublime.set_timeout(self.flush, int(self.interval * 1000))
+
+    def close(self):
+        '''Passes on the errors left and finishes the build's marks.'''
+        if self.partial:
+            self.add(self.partial.decode('utf-8', 'replace') + '\n')
+            self.partial = b''
+        sublime.set_timeout(lambda: self.flush(True), 0)
 
     # Run in main thread.
-    def show_results(self, view, returncode, stdout, stderr):
-        # clear_error_marks()
-        file_name = view.file_name().encode('utf-8')
-        outputView = get_output_view(view.window())
-        outputView.run_command('go_mode_output_insert', {'text': "%s\n%s" % (view.file_name(), stdout.decode("utf-8"))})
-
-        # print("show results: view=%s file=%s" % (view, file_name))
-        # print("stdout\n%s" %(stdout.decode("utf-8")))
-        clear_error_marks_view(file_name)
-        print(stdout.decode("utf-8"))
-        lines = stdout.decode("utf-8").split('\n')
-        for l in lines:
-            # XXX: Compile.
-            #
-            # Building tests with flymake results in file:line:col:error
-            # Building a regular file with flymake results in file:line:error
-            m = re.search('^([^:]+):(\d+):(?:\d+:){0,1} (.*)', l)
-            if m is None:
-                continue
-            f = m.group(1)
-            base = os.path.basename(f)
-            if len(base) > len("flymake_") and base[:len("flymake_")] == "flymake_":
-                base = base[len("flymake_"):]
-            # All files must be in the same directory as the view.file_name()
-            f = os.path.join(os.path.dirname(view.file_name()), base)
-            add_error_mark(f.encode('utf-8'), int(m.group(2))-1, m.group(3))
-        show_error_marks(view)
+    def flush(self, done=False):
+        with self.lock:
+            batch = self.pending
+            self.pending = []
+            self.scheduled = False
+        if not batch and not done:
+            return
+        window = self.view.window()
+        changed = set()
+        if not self.started:
+            self.started = True
+            output.write(window, "%s\n" % (self.filename))
+            changed.add(self.filename)
+            changed.update(self.compiler.reported.get(self.filename, ()))
+            for f in changed:
+                clear_error_marks_view(f)
+        text = ''.join(t for t, errors in batch)
+        if text:
+            output.write(window, text)
+        for t, errors in batch:
+            for (f, line, column, message) in errors:
+                add_error_mark(f, line, message, column)
+                self.reported.add(f)
+                changed.add(f)
+        for f in changed:
+            for view in views_of(f):
+                show_error_marks(view)
+        if done:
+            self.compiler.reported[self.filename] = self.reported
+
+class GoModeCompiler:
+    def __init__(self, workers=None):
+        self.lock = threading.Condition()
+        self.targets = {}
+        # filename -> (key, returncode, output) of the last build.
+        self.results = {}
+        # filename -> the files its last build reported errors in. Only used
+        # on the main thread.
+        self.reported = {}
+        # Package directory -> jobs waiting for it. Jobs for the same
+        # directory share the flymake file names, so they run one at a time.
+        self.pending = collections.OrderedDict()
+        self.busy = set()
+        # The package directory of the active view, which goes first.
+        self.priority = None
+        if workers is None:
+            workers = max(1, min(cpu_count(), 8))
+        self.workers = []
+        for i in range(workers):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+        # Called with the file name when a build finished.
+        self.on_done = None
+
+    def set_priority(self, dirname):
+        with self.lock:
+            self.priority = dirname
 
     # Run in worker thread.
-    def do_compile(self):
+    def next_job(self):
+        with self.lock:
+            while True:
+                dirname = None
+                if self.priority in self.pending and self.priority not in self.busy:
+                    dirname = self.priority
+                else:
+                    for d in self.pending:
+                        if d not in self.busy:
+                            dirname = d
+                            break
+                if dirname is not None:
+                    jobs = self.pending[dirname]
+                    job = jobs.popleft()
+                    if not jobs:
+                        del self.pending[dirname]
+                    self.busy.add(dirname)
+                    return job
+                self.lock.wait()
+
+    # Run in worker thread.
+    def work(self):
         while True:
-            (filename, view, data) = self.queue.get()
+            (filename, view, data, queued) = self.next_job()
             try:
-                print("-> compiling %s" %(filename))
-                dirname = os.path.dirname(filename)
-                flyname = "flymake_" + os.path.basename(filename)
-                target_name = os.path.join(dirname, flyname)
+                self.do_compile(filename, view, data, queued)
+            finally:
+                with self.lock:
+                    del self.targets[filename]
+                    self.busy.discard(os.path.dirname(filename))
+                    print("<- compiling %s - targets=%s" %(filename, self.targets))
+                    self.lock.notify_all()
+                if self.on_done is not None:
+                    self.on_done(filename)
 
-                print("flymake `%s'" % (target_name))
+    # Run in worker thread.
+    def do_compile(self, filename, view, data, queued):
+        try:
+            # Reapply the last results if nothing changed since they were
+            # computed.
+            key = flymake_key(filename, data)
+            with self.lock:
+                memo = self.results.get(filename)
+            if memo is not None and memo[0] == key:
+                diagnostics = GoModeDiagnostics(self, filename, view)
+                diagnostics.feed(memo[2])
+                diagnostics.close()
+                return
 
-                target = open(target_name, "w")
-                target.truncate()
-                target.write(data)
-                target.close()
+            print("-> compiling %s" %(filename))
+            dirname = os.path.dirname(filename)
+            flyname = "flymake_" + os.path.basename(filename)
 
+            # In staging mode the build runs in a mirror of the package
+            # outside of the working tree.
+            env = getenv()
+            staging = get_setting("flymake_staging", False, view)
+            if staging:
+                dirname, scratch = stage.mirror(dirname, env.get("GOPATH", ""))
+                if scratch is not None:
+                    env = dict(env)
+                    env["GOPATH"] = env.get("GOPATH", "") + os.pathsep + scratch
+            target_name = os.path.join(dirname, flyname)
+
+            print("flymake `%s'" % (target_name))
+
+            target = open(target_name, "w")
+            target.truncate()
+            target.write(data)
+            target.close()
+
+            diagnostics = GoModeDiagnostics(self, filename, view)
+            chunks = []
+            try:
                 args = ["goflymake", flyname]
-                env = getenv()
-                p = openProcess(args, cwd=dirname, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE)
-                stdout, stderr = p.communicate()
-                os.unlink(target_name)
-
-                sublime.set_timeout(lambda view=view, code=p.returncode: self.show_results(view, code, stdout, stderr), 0)
+                p = openProcess(args, cwd=dirname, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, stdin=subprocess.PIPE, queued=queued)
+                p.stdin.close()
+                # The errors are marked as they come, not when the build is
+                # over.
+                for data in iter(lambda: p.stdout.read1(65536), b''):
+                    p.payload += len(data)
+                    chunks.append(data)
+                    diagnostics.feed(data)
+                p.stdout.close()
+                p.wait()
+            finally:
+                diagnostics.close()
+                if not staging:
+                    os.unlink(target_name)
+
+            with self.lock:
+                self.results[filename] = (key, p.returncode, b''.join(chunks))
 
-            except Exception as e:
-                print("compilation aborted: %s" % (filename))
-
-            self.lock.acquire(True)
-            del self.targets[filename]
-            print("<- compiling %s - targets=%s" %(filename, self.targets))
-            self.lock.release()
+        except Exception as e:
+            print("compilation aborted: %s" % (filename))
 
-            self.queue.task_done()
+    def is_compiling(self, filename):
+        with self.lock:
+            return filename in self.targets
 
     # Content is filename, view, string
     def compile(self, content):
         (filename, view, data) = content
-        try:
-            self.lock.acquire(True)
-            if content[0] in self.targets:
+        with self.lock:
+            if filename in self.targets:
                 print("COMPILE")
                 print(self.targets)
                 return False
 
-            self.targets[content[0]] = True
-            self.queue.put(content)
+            self.targets[filename] = True
+            dirname = os.path.dirname(filename)
+            if dirname not in self.pending:
+                self.pending[dirname] = collections.deque()
+            self.pending[dirname].append(content + (time.time(),))
+            self.lock.notify()
             return True
-        finally:
-            self.lock.release()
 
 c = GoModeCompiler()
 
+class GoModeFlymakeScheduler:
+    '''Debounces flymake builds on a single thread: a file is built once it
+    was not modified for its delay. If the file is still being built by then,
+    exactly one more build is queued for when that one finishes.'''
+
+    def __init__(self, compiler):
+        self.compiler = compiler
+        compiler.on_done = self.compiled
+        self.lock = threading.Condition()
+        # filename -> (deadline, view)
+        self.due = {}
+        # filename -> view, for the files to build again once their current
+        # build finishes.
+        self.rerun = {}
+        self.worker = None
+
+    def touch(self, view, delay):
+        with self.lock:
+            self.due[view.file_name()] = (time.time() + delay, view)
+            if self.worker is None:
+                self.worker = threading.Thread(target=self.run)
+                self.worker.daemon = True
+                self.worker.start()
+            self.lock.notify()
+
+    def forget(self, filename):
+        with self.lock:
+            self.due.pop(filename, None)
+            self.rerun.pop(filename, None)
+
+    # Run in scheduler thread.
+    def run(self):
+        while True:
+            with self.lock:
+                while True:
+                    now = time.time()
+                    ready = [f for f in self.due if self.due[f][0] <= now]
+                    if ready:
+                        break
+                    timeout = None
+                    if self.due:
+                        timeout = min(d for d, v in self.due.values()) - now
+                    self.lock.wait(timeout)
+                jobs = [(f, self.due.pop(f)[1]) for f in ready]
+            for filename, view in jobs:
+                sublime.set_timeout(lambda filename=filename, view=view: self.build(filename, view), 0)
+
+    # Run in main thread.
+    def build(self, filename, view):
+        if not view_is_valid(view) or view.file_name() != filename:
+            return
+        if self.compiler.compile((filename, view, view.substr(sublime.Region(0, view.size())))):
+            return
+        with self.lock:
+            self.rerun[filename] = view
+        # The build may have finished in the meantime.
+        if not self.compiler.is_compiling(filename):
+            self.compiled(filename)
+
+    # Run in compiler thread.
+    def compiled(self, filename):
+        with self.lock:
+            view = self.rerun.pop(filename, None)
+            if view is not None and filename not in self.due:
+                self.due[filename] = (time.time(), view)
+                self.lock.notify()
+
+scheduler = GoModeFlymakeScheduler(c)
+
 # XXX: Missing some cases.
 class GoModeGoFlymake(sublime_plugin.EventListener):
-    def __init__(self):
-        # view isn't hashable, so this is filename->view.
-        self.views = {}
-        self.recompile_timer = None
-        # Seconds
-        self.recompile_delay = 1.0
-
-    def restart_recompile_timer(self, timeout):
-        # Do a recompile now, but not another for 5s.
-        if self.recompile_timer == None:
-            self.recompile()
-        else:
-            self.recompile_timer.cancel()
-        self.recompile_timer = threading.Timer(timeout, sublime.set_timeout,
-                                               [self.recompile, 0])
-        self.recompile_timer.start()
-
-    # Block recompiles while a compilation is in progress.
-    def recompile(self):
-        erase = []
-        for k in self.views:
-            view = self.views[k]
-            if c.compile((view.file_name(), view, view.substr(sublime.Region(0, view.size())))):
-                erase.append(k)
-            else:
-                self.restart_recompile_timer(1.0)
-        for k in erase:
-            del self.views[k]
-        print(self.views)
+    def on_activated(self, view):
+        if not is_go_source_view(view) or view.file_name() is None:
+            return
+
+        c.set_priority(os.path.dirname(view.file_name()))
 
     def on_modified(self, view):
-        if not is_go_source_view(view):
+        if not is_go_source_view(view) or view.file_name() is None:
             return
 
-        self.views[view.file_name()] = view
-        self.restart_recompile_timer(self.recompile_delay)
+        scheduler.touch(view, get_setting("flymake_delay", 1.0, view))
+
+    def on_close(self, view):
+        if view.file_name() is not None:
+            scheduler.forget(view.file_name())
 
     def show_errors(self, view):
         if not is_go_source_view(view):
@@ -0,0 +1,187 @@
+# A lightweight Go tokenizer. It is not a full lexer: it is good enough to
+# find import declarations, package qualifiers and top level declarations
+# without running a go tool.
+import bisect
+import re
+
+IDENT = "ident"
+NUMBER = "number"
+STRING = "string"
+CHAR = "char"
+OP = "op"
+
+_token_re = re.compile(r'''
+    (?P<space>\s+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<ident>[^\W\d]\w*)
+  | (?P<number>\.?\d(?:[\w.]|[eEpP][-+])*)
+  | (?P<string>"(?:[^"\\\n]|\\.)*"|`[^`]*`)
+  | (?P<char>'(?:[^'\\\n]|\\.)*')
+  | (?P<op>\.\.\.|&\^=?|<<=?|>>=?|&&|\|\||<-|\+\+|--|[-+*/%&|^<>=!:]=|\S)
+''', re.VERBOSE | re.DOTALL)
+
+def tokenize(src):
+    '''Yields (kind, text, offset) for the tokens in src, skipping white space
+    and comments.'''
+    for m in _token_re.finditer(src):
+        kind = m.lastgroup
+        if kind == "space" or kind == "comment":
+            continue
+        yield (kind, m.group(kind), m.start())
+
+def unquote(s):
+    if s.startswith("`"):
+        return s[1:-1]
+    try:
+        return s[1:-1].encode('latin-1', 'backslashreplace').decode('unicode_escape')
+    except UnicodeError:
+        return s[1:-1]
+
+def parse_imports(tokens):
+    '''Parses the package clause and import declarations at the start of
+    tokens, a list of tokens. Returns the imports as a list of (name, path)
+    tuples, where name is None if the import is not named, and the index of
+    the first token after the imports.'''
+    imports = []
+    i = 0
+    if i + 1 < len(tokens) and tokens[i][1] == "package":
+        i += 2
+    while i < len(tokens) and tokens[i][1] == ";":
+        i += 1
+    while i < len(tokens) and tokens[i][1] == "import":
+        i += 1
+        grouped = i < len(tokens) and tokens[i][1] == "("
+        if grouped:
+            i += 1
+        while i < len(tokens):
+            kind, text, pos = tokens[i]
+            if grouped and text == ")":
+                i += 1
+                break
+            if text == ";":
+                i += 1
+                continue
+            name = None
+            if kind == IDENT or text == ".":
+                name = text
+                i += 1
+                if i >= len(tokens):
+                    break
+                kind, text, pos = tokens[i]
+            if kind != STRING:
+                raise ValueError("malformed import at offset %d" % pos)
+            imports.append((name, unquote(text)))
+            i += 1
+            if not grouped:
+                break
+        while i < len(tokens) and tokens[i][1] == ";":
+            i += 1
+    return imports, i
+
+def assumed_name(path):
+    '''Returns the package name for an import path, guessed the same way
+    goimports does: the last path element without a go- prefix or a version
+    suffix.'''
+    name = path.rstrip("/").split("/")[-1]
+    if name.startswith("go-"):
+        name = name[len("go-"):]
+    m = re.match(r'\w+', name)
+    if m is None:
+        return name
+    return m.group(0)
+
+_newline_re = re.compile(r'\n')
+_brackets = ("(", ")", "{", "}", "[", "]")
+
+FUNC = "func"
+METHOD = "method"
+TYPE = "type"
+VAR = "var"
+CONST = "const"
+
+def _names(tokens, i, line_of, same_line):
+    # The identifiers of a spec: one, or a list separated by commas. Returns
+    # (name, offset) tuples.
+    names = []
+    while i < len(tokens) and tokens[i][0] == IDENT:
+        names.append((tokens[i][1], tokens[i][2]))
+        if not same_line or i + 2 >= len(tokens) or tokens[i + 1][1] != ",":
+            break
+        if line_of(tokens[i + 2][2]) != line_of(tokens[i][2]):
+            break
+        i += 2
+    return names
+
+def parse_declarations(src, tokens=None):
+    '''Returns the package name of src and its top level declarations, as a
+    list of (name, kind, receiver, offset) tuples. receiver is the receiver
+    type of methods and None otherwise. tokens are the tokens of src, if the
+    caller has them. Go inserts semicolons at line ends, so the specs of a
+    grouped declaration are taken to start a line.'''
+    if tokens is None:
+        tokens = list(tokenize(src))
+    newlines = [m.start() for m in _newline_re.finditer(src)]
+    line_of = lambda offset: bisect.bisect_left(newlines, offset)
+
+    def rest_of_spec(i):
+        # The last token of the spec at i on its line, short of brackets,
+        # which must be counted.
+        line = line_of(tokens[i][2])
+        while i + 1 < n and line_of(tokens[i + 1][2]) == line and tokens[i + 1][1] not in _brackets:
+            i += 1
+        return i
+
+    package = None
+    decls = []
+    depth = 0
+    # The keyword of the var, const or type group we are in.
+    group = None
+    i = 0
+    n = len(tokens)
+    while i < n:
+        kind, text, pos = tokens[i]
+        if text in ("(", "{", "["):
+            depth += 1
+        elif text in (")", "}", "]"):
+            depth -= 1
+            if depth <= 0:
+                depth = 0
+                group = None
+        elif depth == 0 and text == "package" and package is None and i + 1 < n:
+            package = tokens[i + 1][1]
+            i += 1
+        elif depth == 0 and kind == IDENT and text == "func":
+            receiver = None
+            j = i + 1
+            if j < n and tokens[j][1] == "(":
+                # The receiver type is the last identifier in the parens.
+                level = 0
+                while j < n:
+                    if tokens[j][1] == "(":
+                        level += 1
+                    elif tokens[j][1] == ")":
+                        level -= 1
+                        if level == 0:
+                            break
+                    elif tokens[j][0] == IDENT:
+                        receiver = tokens[j][1]
+                    j += 1
+                j += 1
+            if j < n and tokens[j][0] == IDENT:
+                decls.append((tokens[j][1], METHOD if receiver else FUNC, receiver, tokens[j][2]))
+                i = j
+        elif depth == 0 and kind == IDENT and text in (TYPE, VAR, CONST):
+            if i + 1 < n and tokens[i + 1][1] == "(":
+                group = text
+                depth = 1
+                i += 2
+                continue
+            for name, offset in _names(tokens, i + 1, line_of, text != TYPE):
+                decls.append((name, text, None, offset))
+            i = rest_of_spec(i)
+        elif group is not None and depth == 1 and kind == IDENT and line_of(tokens[i - 1][2]) != line_of(pos):
+            for name, offset in _names(tokens, i, line_of, group != TYPE):
+                decls.append((name, group, None, offset))
+            i = rest_of_spec(i)
+        i += 1
+    return package, [d for d in decls if d[0] != "_"]
@@ -0,0 +1,117 @@
+# Character to byte offset conversion for views. The go tools take utf-8 byte
+# offsets while sublime works in characters, so we keep per buffer the byte
+# offset of the start of each line. The index is extended lazily up to the
+# line that is asked for, and truncated at the first line an edit may have
+# touched. Only edits made by a command that edits at the selection are
+# located that way; after any other edit, or one that wasn't seen, the index
+# is dropped.
+import sublime
+import sublime_plugin
+
+class ByteOffsetIndex:
+    def __init__(self):
+        # The character and byte offsets of the start of each known line.
+        self.chars = [0]
+        self.bytes = [0]
+        # view id -> the first selected row, as of the last selection
+        # change. Clones share the index but not the selection.
+        self.sel_rows = {}
+        # The buffer's change count the index is up to date with.
+        self.change_count = 0
+
+    def invalidate(self, row=0):
+        del self.chars[row + 1:]
+        del self.bytes[row + 1:]
+
+    def extend(self, view, row):
+        n = len(self.chars) - 1
+        if n >= row:
+            return
+        c = self.chars[n]
+        b = self.bytes[n]
+        text = view.substr(sublime.Region(c, view.text_point(row, 0)))
+        # Sublime only breaks lines on \n.
+        for line in text.split('\n')[:-1]:
+            c += len(line) + 1
+            b += len(line.encode('utf-8')) + 1
+            self.chars.append(c)
+            self.bytes.append(b)
+
+    def byte_offset(self, view, pos):
+        row, col = view.rowcol(pos)
+        start = view.text_point(row, 0)
+        if view.change_count() != self.change_count or (row < len(self.chars) and self.chars[row] != start):
+            # The view changed in a way we didn't see.
+            self.invalidate()
+            self.change_count = view.change_count()
+        self.extend(view, row)
+        return self.bytes[row] + len(view.substr(sublime.Region(start, pos)).encode('utf-8'))
+
+# buffer id -> ByteOffsetIndex
+indexes = {}
+
+def byte_offset(view, pos):
+    '''Returns the utf-8 byte offset of the character offset pos in view.'''
+    index = indexes.get(view.buffer_id())
+    if index is None:
+        index = ByteOffsetIndex()
+        index.sel_rows[view.id()] = first_selected_row(view)
+        index.change_count = view.change_count()
+        indexes[view.buffer_id()] = index
+    return index.byte_offset(view, pos)
+
+def invalidate(view):
+    '''Drops the index for view, for changes that may touch any line.'''
+    indexes.pop(view.buffer_id(), None)
+
+# The commands that only edit at the selection.
+selection_commands = frozenset([
+    "insert", "insert_snippet", "left_delete", "right_delete", "delete_word",
+    "paste", "cut", "undo", "redo", "soft_undo", "soft_redo",
+    "commit_completion", "insert_best_completion", "insert_completion",
+    "reindent", "indent", "unindent", "toggle_comment", "duplicate_line",
+    "join_lines", "run_macro_file",
+])
+
+def first_selected_row(view):
+    s = view.sel()
+    if len(s) == 0:
+        return 0
+    return view.rowcol(s[0].begin())[0]
+
+class GoModeOffsetTracker(sublime_plugin.EventListener):
+    def on_modified(self, view):
+        index = indexes.get(view.buffer_id())
+        if index is None:
+            return
+        command = view.command_history(0, True)[0]
+        row = first_selected_row(view)
+        if view.change_count() != index.change_count + 1 or command not in selection_commands:
+            # Edits we missed, or one that may be anywhere.
+            index.invalidate()
+        else:
+            # An edit starts at the selection as it was before the edit
+            # (typing, pasting) or as it is after it (undo, which selects
+            # what it restores). The edited line's start doesn't move, so
+            # the index is valid up to and including it.
+            index.invalidate(min(row, index.sel_rows.get(view.id(), 0)))
+        index.sel_rows[view.id()] = row
+        index.change_count = view.change_count()
+
+    def on_selection_modified(self, view):
+        index = indexes.get(view.buffer_id())
+        if index is not None:
+            index.sel_rows[view.id()] = first_selected_row(view)
+
+    def on_load(self, view):
+        invalidate(view)
+
+    def on_revert(self, view):
+        invalidate(view)
+
+    def on_close(self, view):
+        index = indexes.get(view.buffer_id())
+        if index is not None:
+            index.sel_rows.pop(view.id(), None)
+            if not index.sel_rows:
+                invalidate(view)
@@ -9,20 +9,19 @@ It depends on the oracle tool being installed:
 go get code.google.com/p/go.tools/cmd/oracle
 """
 
-import sublime, sublime_plugin, subprocess, time, re
+import sublime, sublime_plugin, subprocess, time, re, os, threading, collections, json
 
 from .common import *
+from . import offsets
 
 class GoModeOracleCommand(sublime_plugin.TextCommand):
     def run(self, edit, mode=None):
 
         region = self.view.sel()[0]
-        text = self.view.substr(sublime.Region(0, region.end()))
-        cb_map = self.get_map(text)
-        byte_end = cb_map[sorted(cb_map.keys())[-1]]
+        byte_end = offsets.byte_offset(self.view, max(region.end() - 1, 0))
         byte_begin = None
         if not region.empty():
-            byte_begin = cb_map[region.begin()-1]
+            byte_begin = offsets.byte_offset(self.view, max(region.begin() - 1, 0))
 
         if mode:
             self.write_running(mode)
@@ -51,8 +50,8 @@ class GoModeOracleCommand(sublime_plugin.TextCommand):
 
         self.view.window().show_quick_panel(descriptions, on_done, sublime.MONOSPACE_FONT)
 
-    def oracle_complete(self, out, err):
-        self.write_out(out, err)
+    def oracle_complete(self, out, err, cached=False):
+        self.write_out(out, err, cached)
 
     def write_running(self, mode):
         """ Write the "Running..." header to a new file and focus it to get results
@@ -69,7 +68,7 @@ class GoModeOracleCommand(sublime_plugin.TextCommand):
         else:
             window.focus_view(view)
 
-    def write_out(self, result, err):
+    def write_out(self, result, err, cached=False):
         """ Write the oracle output to a new file.
         """
 
@@ -79,76 +78,257 @@ class GoModeOracleCommand(sublime_plugin.TextCommand):
         # Run a new command to use the edit object for this view.
         view.run_command('go_mode_oracle_write_results', {
             'result': result,
-            'err': err})
+            'err': err,
+            'format': self.output_format,
+            'cached': cached})
 
         if get_setting("output", "buffer") == "output_panel":
             window.run_command('show_panel', {'panel': "output." + view.name() })
         else:
             window.focus_view(view)
 
-    def get_map(self, chars):
-        """ Generate a map of character offset to byte offset for the given string 'chars'.
-        """
-
-        byte_offset = 0
-        cb_map = {}
-
-        for char_offset, char in enumerate(chars):
-            cb_map[char_offset] = byte_offset
-            byte_offset += len(char.encode('utf-8'))
-        return cb_map
-
     def oracle(self, end_offset, begin_offset=None, mode="describe", callback=None):
-        """ Builds the oracle shell command and calls it, returning it's output as a string.
+        """ Builds the oracle command and runs it in the background. The output
+        is streamed into the output view, cached results are passed to callback.
         """
 
         pos = "#" + str(end_offset)
         if begin_offset is not None:
             pos = "#%i,#%i" %(begin_offset, end_offset)
-        env = get_setting("env")
-
-        # Build oracle cmd.
-        cmd = "export GOPATH=\"%(go_path)s\"; export PATH=%(path)s; oracle -pos=%(file_path)s:%(pos)s -format=%(output_format)s %(mode)s %(scope)s"  % {
-        "go_path": env["GOPATH"],
-        "path": env["PATH"],
-        "file_path": self.view.file_name(),
-        "pos": pos,
-        "output_format": get_setting("oracle_format"),
-        "mode": mode,
-        # TODO if scpoe is not set, use main.go under pwd or sublime project path.
-        "scope": ' '.join(get_setting("oracle_scope"))}
 
-        if "GOROOT" in env:
-            gRoot = "export GOROOT=\"%s\"; " % env["GOROOT"]
-            cmd = gRoot + cmd
+        output_format = get_setting("oracle_format")
+        self.output_format = output_format
+        # TODO if scpoe is not set, use main.go under pwd or sublime project path.
+        scope = get_setting("oracle_scope")
+        args = ["oracle", "-pos=%s:%s" % (self.view.file_name(), pos), "-format=%s" % output_format, mode] + scope
 
-        sublime.set_timeout_async(lambda: self.runInThread(cmd, callback), 0)
+        key = (mode, self.view.file_name(), pos, output_format, tuple(scope))
+        # A new query cancels the one in flight.
+        generation = runner.next()
+        queued = time.time()
+        sublime.set_timeout_async(lambda: self.runInThread(generation, key, args, callback, queued), 0)
 
-    def runInThread(self, cmd, callback):
+    def runInThread(self, generation, key, args, callback, queued):
         start = time.time()
-        proc = openProcess(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, shell=True)
-        out, err = proc.communicate()
+        env = getenv()
+        key += (source_fingerprint(env.get("GOPATH", ""), key[4], os.path.dirname(key[1])),)
+        result = results_cache.get(key)
+        if result is not None:
+            callback(result[0], result[1], cached=True)
+            return
+
+        # Stream the output into the view while oracle runs.
+        output_format = key[3]
+        sublime.set_timeout(lambda: self.write_chunk("\n", "plain"), 0)
+        stream = OutputStream(lambda text: self.write_chunk(text, output_format), get_setting("output_limit", 2000000))
+        returncode, err = runner.run(generation, args, env, stream, queued)
+        stream.close()
         print("oracle command ran in %.2fs" % (time.time() - start))
-        callback(out.decode('utf-8'), err.decode('utf-8'))
+        if stream.dropped:
+            err += "... output truncated, %d characters not shown\n" % stream.dropped
+        if returncode == 0:
+            results_cache.put(key, (stream.text(), err))
+        sublime.set_timeout(lambda: self.write_chunk(err + "\n\n\n", "plain"), 0)
+
+    def write_chunk(self, text, format):
+        """ Appends part of the oracle output to the output view.
+        """
+
+        view = get_output_view(self.view.window())
+        view.run_command('go_mode_oracle_append', {'text': text, 'format': format})
+
+class OracleRunner:
+    """ Runs one oracle process at a time, with a time budget. Starting a new
+    query or cancelling stops the process in flight.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.proc = None
+
+    def next(self):
+        with self.lock:
+            self.generation += 1
+            self.stop("cancelled by a newer query")
+            return self.generation
+
+    def cancel(self):
+        with self.lock:
+            return self.stop("cancelled")
+
+    def running(self):
+        with self.lock:
+            return self.proc is not None and self.proc.poll() is None
+
+    # Called with the lock held.
+    def stop(self, reason):
+        if self.proc is None or self.proc.poll() is not None:
+            return False
+        self.proc.stopped = reason
+        self.proc.kill()
+        return True
+
+    def expire(self, proc, timeout):
+        with self.lock:
+            if proc.poll() is None:
+                proc.stopped = "timed out after %ss" % timeout
+                proc.kill()
+
+    def run(self, generation, args, env, stream, queued=None):
+        """ Runs oracle, feeding its stdout to stream as it arrives. Returns
+        the exit status and stderr of oracle. The exit status is None if
+        oracle was stopped.
+        """
+
+        with self.lock:
+            if generation != self.generation:
+                return None, "oracle cancelled by a newer query\n"
+            proc = openProcess(args, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, stdin=subprocess.PIPE, queued=queued)
+            proc.stdin.close()
+            proc.stopped = None
+            self.proc = proc
+
+        timer = None
+        timeout = get_setting("oracle_timeout", 0)
+        if timeout:
+            timer = threading.Timer(timeout, self.expire, [proc, timeout])
+            timer.daemon = True
+            timer.start()
+
+        err = []
+        t = threading.Thread(target=lambda: err.append(proc.stderr.read()))
+        t.daemon = True
+        t.start()
+        for data in iter(lambda: proc.stdout.read1(65536), b''):
+            proc.payload += len(data)
+            stream.feed(data)
+        t.join()
+        proc.payload += len(err[0])
+        proc.wait()
+        if timer is not None:
+            timer.cancel()
+
+        with self.lock:
+            if self.proc is proc:
+                self.proc = None
+        err = err[0].decode('utf-8', 'replace')
+        if proc.stopped is not None:
+            return None, err + "oracle %s\n" % proc.stopped
+        return proc.returncode, err
+
+runner = OracleRunner()
+
+class GoModeOracleCancelCommand(sublime_plugin.WindowCommand):
+    def run(self):
+        if not runner.cancel():
+            sublime.status_message("oracle is not running")
+
+    def is_enabled(self):
+        return runner.running()
+
+def source_fingerprint(gopath, scope, dirname):
+    """ Returns a fingerprint of the names, sizes and mtimes of the Go files in
+    the scope packages, and the packages below them, and in dirname.
+    """
+
+    dirs = [dirname]
+    for pkg in scope:
+        for p in gopath.split(os.pathsep):
+            d = os.path.join(p, "src", pkg)
+            if os.path.isdir(d):
+                dirs.append(d)
+                break
+
+    fingerprint = []
+    seen = set()
+    for top in dirs:
+        for root, subdirs, files in os.walk(top):
+            if root in seen:
+                subdirs[:] = []
+                continue
+            seen.add(root)
+            # The go tool ignores these.
+            subdirs[:] = [d for d in subdirs if not d.startswith((".", "_")) and d != "testdata"]
+            for name in files:
+                if not name.endswith(".go"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                fingerprint.append((root, name, st.st_size, st.st_mtime))
+            if top == dirname:
+                break
+    return hash(tuple(sorted(fingerprint)))
+
+class OracleCache:
+    """ A bounded LRU cache of oracle results.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = collections.OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            result = self.results.pop(key, None)
+            if result is not None:
+                self.results[key] = result
+            return result
+
+    def put(self, key, result):
+        with self.lock:
+            self.results.pop(key, None)
+            self.results[key] = result
+            while len(self.results) > max(get_setting("oracle_cache_size", 32), 0):
+                self.results.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.results.clear()
+
+results_cache = OracleCache()
+
+class GoModeOracleCacheInvalidator(sublime_plugin.EventListener):
+    def on_post_save(self, view):
+        if (view.file_name() or "").endswith(".go"):
+            results_cache.clear()
 
 
 class GoModeOracleWriteResultsCommand(sublime_plugin.TextCommand):
     """ Writes the oracle output to the current view.
     """
 
-    def run(self, edit, result, err):
+    def run(self, edit, result, err, format="plain", cached=False):
         view = self.view
 
         view.insert(edit, view.size(), "\n")
 
+        if cached:
+            view.insert(edit, view.size(), "(cached result)\n")
+
         if result:
+            index_locations(view, result, format)
             view.insert(edit, view.size(), result)
+            finish_locations(view)
         if err:
+            index_locations(view, err, "plain")
             view.insert(edit, view.size(), err)
 
         view.insert(edit, view.size(), "\n\n\n")
 
 
+class GoModeOracleAppendCommand(sublime_plugin.TextCommand):
+    """ Appends part of the oracle output to the current view.
+    """
+
+    def run(self, edit, text, format="plain"):
+        view = self.view
+        index_locations(view, text, format)
+        view.insert(edit, view.size(), text)
+
+
 class GoModeOracleWriteRunningCommand(sublime_plugin.TextCommand):
     """ Writes the oracle output to the current view.
     """
@@ -171,6 +351,103 @@ class GoModeOracleShowResultsCommand(sublime_plugin.TextCommand):
             self.view.window().focus_view(output_view)
 
 
+# "filename:line:col" for xml and json.
+xml_location_re = re.compile(r'>([^<]+):([0-9]+):([0-9]+)<')
+json_location_re = re.compile(r'"([^"]+):([0-9]+):([0-9]+)"')
+position_re = re.compile(r'^(.+):([0-9]+):([0-9]+)$')
+# "filename:line.col-line.col: text" for plain, and tool errors.
+plain_location_re = re.compile(r'^([^:]+):([0-9]+)[.:]([0-9]+)[-: ]')
+
+def parse_location(line, format):
+    """ Returns the (filename, line, col) the oracle output line refers to, or None.
+    """
+
+    if format == "json":
+        # "key": "filename:line:col", or a bare "filename:line:col" in a
+        # list such as the refs of referrers.
+        m = json_location_re.search(line)
+    elif format == "xml":
+        m = xml_location_re.search(line)
+    else:
+        m = plain_location_re.match(line)
+    if m:
+        return (m.group(1), int(m.group(2)), int(m.group(3)))
+    return None
+
+# view id -> {row: (filename, line, col)} for the oracle output written to it.
+locations = {}
+# view id -> (first row, [text]) of the json output being written to it.
+json_output = {}
+
+def index_locations(view, text, format):
+    """ Records the locations in text, which is about to be appended to view.
+    Json output is indexed line by line as it streams in, and again from its
+    decoded records once it is complete.
+    """
+
+    if view.size() == 0:
+        locations.pop(view.id(), None)
+        json_output.pop(view.id(), None)
+    row = view.rowcol(view.size())[0]
+    if format == "json":
+        json_output.setdefault(view.id(), (row, []))[1].append(text)
+    else:
+        finish_locations(view)
+    table = locations.setdefault(view.id(), {})
+    for i, line in enumerate(text.split("\n")):
+        loc = parse_location(line, format)
+        if loc is not None:
+            table[row + i] = loc
+
+def json_positions(value, result):
+    """ Appends the "filename:line:col" strings in the decoded json value to
+    result, in document order.
+    """
+
+    if isinstance(value, dict):
+        for v in value.values():
+            json_positions(v, result)
+    elif isinstance(value, list):
+        for v in value:
+            json_positions(v, result)
+    elif isinstance(value, str):
+        m = position_re.match(value)
+        if m:
+            result.append((value, (m.group(1), int(m.group(2)), int(m.group(3)))))
+    return result
+
+def finish_locations(view):
+    """ Indexes the complete json output written to view from its decoded
+    records. Output that doesn't decode, such as truncated output, keeps its
+    line by line index.
+    """
+
+    pending = json_output.pop(view.id(), None)
+    if pending is None:
+        return
+    row, texts = pending
+    text = "".join(texts)
+    try:
+        document = json.loads(text, object_pairs_hook=collections.OrderedDict)
+    except ValueError:
+        return
+    lines = text.split("\n")
+    table = locations.setdefault(view.id(), {})
+    for i in range(len(lines)):
+        table.pop(row + i, None)
+    # Each position is on the first line at or after the previous one that
+    # has it and hasn't been taken by the same position already.
+    i = 0
+    taken = set()
+    for value, loc in json_positions(document, []):
+        token = json.dumps(value, ensure_ascii=False)
+        while i < len(lines) and (token not in lines[i] or (i, token) in taken):
+            i += 1
+        if i == len(lines):
+            break
+        taken.add((i, token))
+        table.setdefault(row + i, loc)
+
 class GoModeOracleOpenResultCommand(sublime_plugin.EventListener):
     def on_selection_modified(self, view):
 
@@ -180,34 +457,32 @@ class GoModeOracleOpenResultCommand(sublime_plugin.EventListener):
         if view.sel()[0].size() == 0:
             return
 
-        lines = view.lines(view.sel()[0])
-        if len(lines) != 1:
+        table = locations.get(view.id())
+        if table is None:
+            return
+        begin, end = view.rowcol(view.sel()[0].begin())[0], view.rowcol(view.sel()[0].end())[0]
+        if begin != end:
             return
 
-        line = view.full_line(lines[0])
-        text = view.substr(line)
-
-        format = get_setting("oracle_format")
-
-        # "filename:line:col" pattern for json
-        m = re.search("\"([^\"]+):([0-9]+):([0-9]+)\"", text)
-
-        # >filename:line:col< pattern for xml
-        if m == None:
-            m = re.search(">([^<]+):([0-9]+):([0-9]+)<", text)
-
-        # filename:line.col-line.col: pattern for plain
-        if m == None:
-            m = re.search("^([^:]+):([0-9]+).([0-9]+)[-: ]", text)
-
-        if m:
+        loc = table.get(begin)
+        if loc:
             w = view.window()
-            new_view = w.open_file(m.group(1) + ':' + m.group(2) + ':' + m.group(3), sublime.ENCODED_POSITION)
+            new_view = w.open_file("%s:%d:%d" % loc, sublime.ENCODED_POSITION)
             group, index = w.get_view_index(new_view)
             if group != -1:
                 w.focus_group(group)
 
+    def on_close(self, view):
+        locations.pop(view.id(), None)
+
+# window id -> oracle output view
+output_views = {}
+
 def get_output_view(window):
+    view = output_views.get(window.id())
+    if view is not None and view_is_valid(view):
+        return view
+
     view = None
     buff_name = 'Oracle Output'
 
@@ -229,4 +504,5 @@ def get_output_view(window):
     view_settings.set('line_numbers', False)
     view.set_syntax_file('Packages/GoMode/GoOracleResults.tmLanguage')
 
+    output_views[window.id()] = view
     return view
@@ -0,0 +1,105 @@
+# Mirrors of package directories outside of the working tree. flymake builds
+# run in a mirror, which links to the package's files, so nothing is written
+# into the source directory. The mirrors live for the whole session so only
+# the file being compiled is rewritten on each build.
+#
+# A package in the GOPATH is mirrored at its import path in a scratch GOPATH,
+# so the go tool sees the same import path, which internal packages depend
+# on. The vendor directories of the package and the directories above it are
+# linked into the mirror. The scratch GOPATH goes after the real one, so that
+# imports still resolve to the working tree.
+import os
+import shutil
+import tempfile
+import hashlib
+import threading
+import atexit
+
+class StagingArea:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.root = None
+        # Package directory -> (mirror directory, scratch GOPATH or None).
+        self.mirrors = {}
+
+    def get_root(self):
+        if self.root is None:
+            # Prefer tmpfs where there is one.
+            base = None
+            if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+                base = "/dev/shm"
+            self.root = tempfile.mkdtemp(prefix="gomode-", dir=base)
+        return self.root
+
+    def mirror(self, dirname, gopath=""):
+        '''Returns the mirror of the package directory dirname, brought up to
+        date with the files currently in dirname, and the scratch GOPATH it
+        is in, or None if dirname is not in gopath.'''
+        with self.lock:
+            entry = self.mirrors.get(dirname)
+            if entry is None:
+                entry = self.create(dirname, gopath)
+                self.mirrors[dirname] = entry
+            self.sync(dirname, entry[0])
+            return entry
+
+    def create(self, dirname, gopath):
+        for p in gopath.split(os.pathsep):
+            src = os.path.join(p, "src")
+            if not p or not dirname.startswith(src + os.sep):
+                continue
+            scratch = os.path.join(self.get_root(), "gopath")
+            mirror = os.path.join(scratch, "src", os.path.relpath(dirname, src))
+            os.makedirs(mirror, exist_ok=True)
+            # The package's own vendor directory is linked by sync.
+            d, m = os.path.dirname(dirname), os.path.dirname(mirror)
+            while d.startswith(src):
+                if os.path.isdir(os.path.join(d, "vendor")):
+                    link(os.path.join(d, "vendor"), os.path.join(m, "vendor"))
+                d, m = os.path.dirname(d), os.path.dirname(m)
+            return mirror, scratch
+
+        h = hashlib.sha1(dirname.encode('utf-8')).hexdigest()[:12]
+        mirror = os.path.join(self.get_root(), "%s_%s" % (os.path.basename(dirname), h))
+        os.mkdir(mirror)
+        return mirror, None
+
+    def sync(self, dirname, mirror):
+        names = set()
+        for name in os.listdir(dirname):
+            if name.startswith("flymake_"):
+                continue
+            source = os.path.join(dirname, name)
+            if not os.path.isfile(source) and not (name == "vendor" and os.path.isdir(source)):
+                continue
+            names.add(name)
+            link(source, os.path.join(mirror, name))
+
+        for name in os.listdir(mirror):
+            target = os.path.join(mirror, name)
+            # The mirrors of packages below this one.
+            if os.path.isdir(target) and not os.path.islink(target):
+                continue
+            if name not in names and not name.startswith("flymake_"):
+                os.unlink(target)
+
+    def remove(self):
+        with self.lock:
+            if self.root is not None:
+                shutil.rmtree(self.root, ignore_errors=True)
+                self.root = None
+                self.mirrors = {}
+
+def link(source, target):
+    if os.path.islink(target):
+        return
+    try:
+        os.symlink(source, target)
+    except (OSError, NotImplementedError, AttributeError):
+        # No symlinks (windows), fall back to a copy that is refreshed when
+        # the source changes.
+        if not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+            shutil.copy2(source, target)
+
+stage = StagingArea()
+atexit.register(stage.remove)
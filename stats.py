@@ -0,0 +1,92 @@
+# Latency statistics for the external tools we run. Every run is recorded
+# per tool in a histogram with logarithmic buckets, so the memory used does
+# not grow with the number of runs.
+import json
+import math
+import threading
+
+# Buckets are 10% wide, starting at 0.1ms.
+_base = 0.1
+_growth = math.log(1.1)
+
+def _bucket(ms):
+    if ms <= _base:
+        return 0
+    return int(math.log(ms / _base) / _growth) + 1
+
+def _bucket_limit(i):
+    return _base * math.exp(i * _growth)
+
+class Histogram:
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, ms):
+        i = _bucket(ms)
+        self.buckets[i] = self.buckets.get(i, 0) + 1
+        self.count += 1
+        self.max = max(self.max, ms)
+
+    def percentile(self, p):
+        if self.count == 0:
+            return 0.0
+        rank = p * self.count
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                return min(_bucket_limit(i), self.max)
+        return self.max
+
+class ToolStats:
+    def __init__(self):
+        self.latency = Histogram()
+        self.wait = Histogram()
+        self.failures = 0
+        self.payload = 0
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.tools = {}
+
+    def record(self, tool, start, duration, status, payload=0, wait=0.0, trace=None):
+        '''Records a run of tool that started at start and took duration
+        seconds, after waiting wait seconds in a queue. payload is the number
+        of bytes sent to and read from the tool. If trace is set, the run is
+        also appended to that file as a line of JSON.'''
+        with self.lock:
+            s = self.tools.get(tool)
+            if s is None:
+                s = self.tools[tool] = ToolStats()
+            s.latency.add(duration * 1000)
+            s.wait.add(wait * 1000)
+            s.payload += payload
+            if status != 0:
+                s.failures += 1
+        if trace:
+            line = json.dumps({"tool": tool, "start": start, "duration": duration,
+                "status": status, "payload": payload, "wait": wait})
+            try:
+                with open(trace, "a") as f:
+                    f.write(line + "\n")
+            except (IOError, OSError) as e:
+                print("cannot write trace: %s" % (e))
+
+    def report(self):
+        lines = ["%-10s %6s %6s %9s %9s %9s %9s %10s" % (
+            "tool", "runs", "failed", "p50 ms", "p95 ms", "p99 ms", "wait p95", "avg bytes")]
+        with self.lock:
+            for tool in sorted(self.tools):
+                s = self.tools[tool]
+                h = s.latency
+                lines.append("%-10s %6d %6d %9.1f %9.1f %9.1f %9.1f %10d" % (
+                    tool, h.count, s.failures, h.percentile(0.5), h.percentile(0.95),
+                    h.percentile(0.99), s.wait.percentile(0.95), s.payload // max(h.count, 1)))
+        if len(lines) == 1:
+            lines.append("no tools have run yet")
+        return "\n".join(lines) + "\n"
+
+stats = Stats()
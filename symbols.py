@@ -0,0 +1,379 @@
+# An index of the top level declarations of the Go packages in the GOPATH and
+# the project folders. It is built in the background with gotoken rather than
+# a go tool, and kept up to date from file mtimes. It serves "GoMode: Go to
+# Symbol" and go to definition for package level identifiers, which only
+# falls back to godef when the index can't tell.
+import sublime
+import sublime_plugin
+import bisect
+import collections
+import os
+import re
+import sys
+import threading
+import time
+
+from .common import *
+from . import gotoken
+
+_newline_re = re.compile(r'\n')
+
+def locate(src, decls):
+    '''Converts the offsets of decls in src to 1-based lines and columns.'''
+    newlines = [m.start() for m in _newline_re.finditer(src)]
+    result = []
+    for name, kind, receiver, offset in decls:
+        line = bisect.bisect_left(newlines, offset)
+        col = offset - (newlines[line - 1] + 1 if line > 0 else 0)
+        result.append((sys.intern(name), kind, receiver, line + 1, col + 1))
+    return tuple(result)
+
+def parse_file(path):
+    with open(path, 'rb') as f:
+        src = f.read().decode('utf-8', 'replace')
+    package, decls = gotoken.parse_declarations(src)
+    return package, locate(src, decls)
+
+class SymbolIndex:
+    def __init__(self):
+        self.lock = threading.Condition()
+        # directory -> {file name -> (mtime, size, package, decls)}, where
+        # decls is a tuple of (name, kind, receiver, line, col).
+        self.dirs = {}
+        # The roots of the last scan, and when it was requested.
+        self.roots = []
+        self.scanned = 0
+        # Work for the indexer thread: roots to scan, and directories to
+        # index first.
+        self.scan_roots = None
+        self.pending = collections.OrderedDict()
+        self.worker = None
+
+    def start(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.run)
+            self.worker.daemon = True
+            self.worker.start()
+
+    def stale(self, interval):
+        return time.time() - self.scanned > interval
+
+    def refresh(self, roots):
+        '''Rescans roots in the background. Only files whose mtime or size
+        changed are parsed again.'''
+        with self.lock:
+            self.roots = roots
+            self.scanned = time.time()
+            self.scan_roots = roots
+            self.start()
+            self.lock.notify()
+
+    def update(self, dirname):
+        '''Indexes dirname again in the background, ahead of any scan.'''
+        with self.lock:
+            self.pending[dirname] = True
+            self.start()
+            self.lock.notify()
+
+    # Run in indexer thread.
+    def run(self):
+        while True:
+            dirname = None
+            with self.lock:
+                while self.scan_roots is None and not self.pending:
+                    self.lock.wait()
+                if self.pending:
+                    dirname = self.pending.popitem(last=False)[0]
+                else:
+                    roots = self.scan_roots
+                    self.scan_roots = None
+            try:
+                if dirname is not None:
+                    self.index_dir(dirname)
+                else:
+                    self.scan(roots)
+            except Exception as e:
+                print("symbol index: %s" % (e))
+
+    # Run in indexer thread.
+    def scan(self, roots):
+        seen = set()
+        for root in roots:
+            for dirpath, dirnames, filenames in os.walk(root):
+                dirnames[:] = [d for d in dirnames if d[0] not in "._" and d != "testdata"]
+                if any(f.endswith(".go") for f in filenames):
+                    self.index_dir(dirpath, filenames)
+                    seen.add(dirpath)
+                # Directories changed by a save go first.
+                with self.lock:
+                    pending = list(self.pending)
+                    self.pending.clear()
+                for d in pending:
+                    self.index_dir(d)
+        with self.lock:
+            for d in list(self.dirs):
+                if d not in seen and any(d.startswith(os.path.join(root, "")) or d == root for root in roots):
+                    del self.dirs[d]
+
+    # Run in indexer thread.
+    def index_dir(self, dirname, names=None):
+        if names is None:
+            try:
+                names = os.listdir(dirname)
+            except OSError:
+                names = []
+        with self.lock:
+            old = self.dirs.get(dirname, {})
+        files = {}
+        for name in names:
+            if not name.endswith(".go") or name.startswith("flymake_"):
+                continue
+            path = os.path.join(dirname, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entry = old.get(name)
+            if entry is None or entry[0] != st.st_mtime or entry[1] != st.st_size:
+                try:
+                    package, decls = parse_file(path)
+                except (IOError, OSError):
+                    continue
+                entry = (st.st_mtime, st.st_size, package, decls)
+            files[name] = entry
+        with self.lock:
+            if files:
+                self.dirs[dirname] = files
+            else:
+                self.dirs.pop(dirname, None)
+
+    def files(self, dirname):
+        '''Returns the indexed files of dirname, or None if it is not
+        indexed.'''
+        with self.lock:
+            return self.dirs.get(dirname)
+
+    def package_name(self, dirname):
+        files = self.files(dirname)
+        if files is None:
+            return None
+        for name in sorted(files):
+            package = files[name][2]
+            if package and not package.endswith("_test"):
+                return package
+        return None
+
+    def lookup(self, dirname, package, name, skip=None):
+        '''Returns the location, as file:line:col, of the package level
+        declaration of name in package in dirname. skip is a file name to
+        leave out.'''
+        files = self.files(dirname)
+        if files is None:
+            return None
+        for fname in sorted(files):
+            mtime, size, pkg, decls = files[fname]
+            if pkg != package or fname == skip:
+                continue
+            for d in decls:
+                if d[0] == name and d[1] != gotoken.METHOD:
+                    return "%s:%d:%d" % (os.path.join(dirname, fname), d[3], d[4])
+        return None
+
+    def symbols(self, first=None):
+        '''Returns all the symbols as (label, description, location) tuples,
+        with those of the directory first at the start.'''
+        with self.lock:
+            dirs = dict(self.dirs)
+            roots = list(self.roots)
+        order = sorted(dirs)
+        if first in dirs:
+            order.remove(first)
+            order.insert(0, first)
+        result = []
+        for dirname in order:
+            rel = dirname
+            for root in roots:
+                if dirname.startswith(os.path.join(root, "")):
+                    rel = os.path.relpath(dirname, root)
+                    break
+            files = dirs[dirname]
+            for fname in sorted(files):
+                mtime, size, package, decls = files[fname]
+                path = os.path.join(dirname, fname)
+                for name, kind, receiver, line, col in decls:
+                    label = "%s.%s" % (receiver, name) if receiver else name
+                    result.append((label, "%s %s  %s:%d" % (package, kind, os.path.join(rel, fname), line),
+                                   "%s:%d:%d" % (path, line, col)))
+        return result
+
+index = SymbolIndex()
+
+def index_roots(window, view=None):
+    '''Returns the directories to index: the src directories of the GOPATH
+    and the folders of the window's project.'''
+    env = getenv(view)
+    roots = [os.path.join(p, "src") for p in env.get("GOPATH", "").split(os.pathsep) if p]
+    roots = [r for r in roots if os.path.isdir(r)]
+    if window is not None:
+        for folder in window.folders():
+            if not any(folder == r or folder.startswith(os.path.join(r, "")) for r in roots):
+                roots.append(folder)
+    return roots
+
+def import_dir(path, env, srcdir=None):
+    '''Returns the directory of the package with import path, as imported
+    from the package in srcdir, or None. As with the go tool, the vendor
+    directories from srcdir up to the src directory it is in come first.'''
+    roots = [p for p in env.get("GOPATH", "").split(os.pathsep) if p]
+    goroot = env.get("GOROOT")
+    if goroot:
+        roots.append(goroot)
+    dirs = []
+    for root in roots:
+        src = os.path.join(root, "src")
+        if srcdir is None or not srcdir.startswith(src + os.sep):
+            continue
+        # Packages under testdata don't see vendor directories.
+        if "testdata" not in srcdir[len(src):].split(os.sep):
+            d = srcdir
+            while True:
+                dirs.append(os.path.join(d, "vendor", path))
+                if d == src:
+                    break
+                d = os.path.dirname(d)
+        break
+    dirs += [os.path.join(p, "src", path) for p in env.get("GOPATH", "").split(os.pathsep) if p]
+    if goroot:
+        dirs += [os.path.join(goroot, "src", path), os.path.join(goroot, "src", "pkg", path)]
+    for d in dirs:
+        if os.path.isdir(d):
+            return d
+    return None
+
+_type_start = ("*", "[", "...", "<-")
+
+def bound_locally(tokens, name):
+    '''Reports whether tokens, the declaration the cursor is in up to the
+    cursor, may bind name: as a variable, constant, type, parameter or
+    result. It errs on the side of yes.'''
+    n = len(tokens)
+    for k in range(n):
+        kind, text, pos = tokens[k]
+        if kind != gotoken.IDENT or text != name:
+            continue
+        prev = tokens[k - 1][1] if k > 0 else ""
+        if prev == ".":
+            continue
+        # Skip the rest of a list of identifiers.
+        j = k + 1
+        while j + 1 < n and tokens[j][1] == "," and tokens[j + 1][0] == gotoken.IDENT:
+            j += 2
+        following = tokens[j] if j < n else (None, "", 0)
+        if following[1] == ":=":
+            return True
+        b = k - 1
+        while b >= 1 and tokens[b][1] == "," and tokens[b - 1][0] == gotoken.IDENT:
+            b -= 2
+        if b >= 0 and tokens[b][1] in ("var", "const", "type"):
+            return True
+        # Parameters, results and receivers: (a, b int) or (a int, b int).
+        if prev in ("(", ",") and (following[0] == gotoken.IDENT or following[1] in _type_start):
+            return True
+    return False
+
+def definition(view, pos):
+    '''Returns the location, as file:line:col, of the package level
+    declaration of the identifier at pos in view, or None if the index can't
+    tell, for godef to find out.'''
+    filename = view.file_name()
+    if filename is None:
+        return None
+    src = view.substr(sublime.Region(0, view.size()))
+    tokens = list(gotoken.tokenize(src))
+
+    # The identifier at pos, and the declaration it is in.
+    k = None
+    scope = 0
+    depth = 0
+    for i, (kind, text, offset) in enumerate(tokens):
+        if offset > pos:
+            break
+        if text in ("(", "{", "["):
+            depth += 1
+        elif text in (")", "}", "]"):
+            depth -= 1
+        elif depth == 0 and text in ("func", "var", "const", "type"):
+            scope = i
+        if kind == gotoken.IDENT and offset <= pos <= offset + len(text):
+            k = i
+            break
+    if k is None:
+        return None
+    name = tokens[k][1]
+    if k + 1 < len(tokens) and tokens[k + 1][1] == ":":
+        # A struct field key or a label.
+        return None
+    # The declaration up to the end of the cursor's line, which has the
+    # rest of name := ...
+    end = src.find("\n", tokens[k][2])
+    if end < 0:
+        end = len(src)
+    j = k + 1
+    while j < len(tokens) and tokens[j][2] < end:
+        j += 1
+    local = tokens[scope:j]
+
+    try:
+        imports, body = gotoken.parse_imports(tokens)
+    except ValueError:
+        return None
+    env = getenv(view)
+
+    if k >= 2 and tokens[k - 1][1] == "." and tokens[k - 2][0] == gotoken.IDENT and (k < 3 or tokens[k - 3][1] != "."):
+        # A qualified identifier, pkg.Name.
+        qualifier = tokens[k - 2][1]
+        if not name[0].isupper() or bound_locally(local, qualifier):
+            return None
+        for local_name, path in imports:
+            d = import_dir(path, env, os.path.dirname(filename))
+            if d is None:
+                continue
+            if local_name is None:
+                local_name = index.package_name(d) or gotoken.assumed_name(path)
+            if local_name != qualifier:
+                continue
+            if index.files(d) is None:
+                # Ready for the next time.
+                index.update(d)
+                return None
+            return index.lookup(d, index.package_name(d), name)
+        return None
+
+    if (k > 0 and tokens[k - 1][1] == ".") or bound_locally(local, name):
+        return None
+    if any((n or gotoken.assumed_name(p)) == name for n, p in imports):
+        return None
+
+    # The buffer may not be saved, so its own declarations come from it.
+    package, decls = gotoken.parse_declarations(src, tokens)
+    for d in locate(src, decls):
+        if d[0] == name and d[1] != gotoken.METHOD:
+            return "%s:%d:%d" % (filename, d[3], d[4])
+    dirname = os.path.dirname(filename)
+    if index.files(dirname) is None:
+        index.update(dirname)
+        return None
+    return index.lookup(dirname, package, name, os.path.basename(filename))
+
+class GoModeSymbolIndexer(sublime_plugin.EventListener):
+    def on_activated(self, view):
+        if view.file_name() is None or not view.file_name().endswith(".go"):
+            return
+        if not get_setting("symbol_index", True, view):
+            return
+        if index.stale(get_setting("symbol_index_interval", 300, view)):
+            index.refresh(index_roots(view.window(), view))
+
+    def on_post_save(self, view):
+        if view.file_name() is not None and view.file_name().endswith(".go"):
+            index.update(os.path.dirname(view.file_name()))